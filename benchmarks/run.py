@@ -0,0 +1,162 @@
+# Program: SSPS benchmark runner
+#
+# Description: Runs every SSPS workload (*.ssps) in this directory, in both dynamic and static mode, and reports
+#              how fast each one compiles (tokens per second) and runs (operators and procedure calls per second).
+#              The results are compared against a stored baseline, flagging any workload that compiles or runs
+#              slower than the allowed tolerance. Everything runs offline, in this process, against the ssps.py next
+#              to this directory.
+#
+# How to use: Run the command "python benchmarks/run.py [flags] [workload-filenames]", running every workload in
+#             this directory if no filenames are given. Exits with status 1 if any workload regressed.
+#
+#             Optional Flags:
+#                    --save : Save this run's results as the new baseline instead of comparing against it.
+#                    --baseline=filename : Use filename as the baseline (benchmarks/baseline.json by default).
+#                    --tolerance=percent : Flag workloads compiling or running more than percent slower than the
+#                                          baseline (20 by default).
+#                    --repeat=count : Time each workload count times, keeping the fastest (5 by default).
+
+import contextlib
+import gc
+import glob
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import ssps
+
+
+# ---------------\
+# Measuring Runs |
+# ---------------/
+
+
+def count_ops(filename, static):
+    """
+    Runs the workload in the file filename once with the profiler on.
+    Returns the number of operators and procedure calls it executes.
+    """
+    interpreter = ssps.Interpreter(static, profiling=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        interpreter.run_stream(ssps.compile_stream(ssps.read_tokens(filename)))
+    profiler = interpreter.profiler
+    return (sum(calls for (calls, elapsed) in profiler.operators.values())
+            + sum(calls for (calls, cumulative, own) in profiler.procedures.values()))
+
+
+def time_run(filename, static):
+    """
+    Compiles and runs the workload in the file filename in a fresh interpreter, throwing away its output.
+    Returns the seconds spent compiling and the seconds spent running.
+    """
+    # Start from a cold code cache, so every run compiles the whole program.
+    ssps.code_cache.clear()
+    # Keep the garbage collector from adding its own noise to the timings, like timeit does.
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        instructions = list(ssps.compile_stream(ssps.read_tokens(filename)))
+        compiled = time.perf_counter()
+        interpreter = ssps.Interpreter(static)
+        with contextlib.redirect_stdout(io.StringIO()):
+            interpreter.run_stream(instructions)
+        finished = time.perf_counter()
+    finally:
+        gc.enable()
+    return (compiled - start, finished - compiled)
+
+
+def measure(filename, static, repeat):
+    """
+    Measures the workload in the file filename, keeping the fastest of repeat runs.
+    Returns a dictionary of its tokens per second and ops per second.
+    """
+    tokens = sum(1 for token in ssps.read_tokens(filename))
+    ops = count_ops(filename, static)
+    (compiling, running) = min(time_run(filename, static) for i in range(repeat))
+    return {"tokens_per_second": tokens / compiling, "ops_per_second": ops / running}
+
+
+# -----------------------\
+# Comparing to Baseline |
+# -----------------------/
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints every result next to its baseline, with the change in both tokens per second and ops per second,
+    flagging any that is more than tolerance percent slower at either.
+    Returns True if any result regressed, False if not.
+    """
+    regressed = False
+    print("%-24s %14s %14s %8s %8s" % ("Workload", "Tokens/s", "Ops/s", "Tokens", "Ops"))
+    for (name, result) in results.items():
+        line = "%-24s %14.0f %14.0f" % (name, result["tokens_per_second"], result["ops_per_second"])
+        if name in baseline:
+            slower = False
+            for metric in ("tokens_per_second", "ops_per_second"):
+                change = result[metric] / baseline[name][metric] - 1
+                line += " %+7.1f%%" % (change * 100)
+                slower = slower or change * 100 < -tolerance
+            if slower:
+                line += "  REGRESSION"
+                regressed = True
+        print(line)
+    return regressed
+
+
+# ----------------\
+# Main Code Block |
+# ----------------/
+
+
+if __name__ == "__main__":
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    save = False
+    baseline_filename = os.path.join(here, "baseline.json")
+    tolerance = 20.0
+    repeat = 5
+
+    filenames = []
+    for arg in sys.argv[1:]:
+        if arg == "--save":
+            save = True
+        elif arg.startswith("--baseline="):
+            baseline_filename = arg[len("--baseline="):]
+        elif arg.startswith("--tolerance="):
+            tolerance = float(arg[len("--tolerance="):])
+        elif arg.startswith("--repeat="):
+            repeat = int(arg[len("--repeat="):])
+        elif arg[0] == '-':
+            print("Command line argument '", arg, "' not recognized. Skipping...", sep="")
+        else:
+            filenames.append(arg)
+    filenames = filenames or sorted(glob.glob(os.path.join(here, "*.ssps")))
+
+    # Run every workload in both scoping modes, since they resolve names differently.
+    results = {}
+    for filename in filenames:
+        for (mode, static) in (("dynamic", False), ("static", True)):
+            name = os.path.splitext(os.path.basename(filename))[0] + " (" + mode + ")"
+            results[name] = measure(filename, static, repeat)
+
+    if save:
+        with open(baseline_filename, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        compare(results, {}, tolerance)
+        print("Saved baseline to", baseline_filename)
+    else:
+        try:
+            with open(baseline_filename) as file:
+                baseline = json.load(file)
+        except IOError:
+            print("No baseline at", baseline_filename + ", run with --save to make one.")
+            baseline = {}
+        if compare(results, baseline, tolerance):
+            sys.exit(1)
@@ -7,6 +7,9 @@
 #              is dynamically scoped by default (with an optional flag to behave as if statically
 #              scoped), so that the dictionary stack is handled by the compiler instead of the user.
 #              Floating point numbers are not currently supported in SSPS.
+#              Besides recursion, code arrays can be looped over with "n {...} repeat", "initial increment limit
+#              {...} for" (which pushes each value before running the code array) and "{...} loop", which runs until
+#              an "exit" inside it. Loop bodies run in the current dictionary, like if bodies, under either scoping.
 #
 # How to use: Run the command "python ssps.py [flags] input-filename" or "python3 [flags] ssps.py input-filename",
 #             depending on how python is installed on your system. The program defaults with debug mode off and
@@ -16,487 +19,2690 @@
 #                    -x : Run in debug mode, producing detailed debugging output while interpreting the program code.
 #                    -s : Run in static mode, running the program as if SSPS is statically scoped.
 #                    -d : Run in dynamic mode, running the program code as if SSPS is dynamically scoped.
+#                    -b : Run in batch mode, running every input file (and every file listed, one per line, in any
+#                         @manifest-filename argument) in its own interpreter across a pool of worker processes,
+#                         printing each program's output in order under a "==== filename ====" header.
+#                    -i : Run in session mode, running any input files first, then reading SSPS from stdin line by
+#                         line, running each fragment as soon as its code arrays are closed, with the stacks (and
+#                         every definition) kept from one fragment to the next. Errors are reported, not fatal.
+#                    -u : Like -i, but serve the session over a Unix domain socket at the last filename argument
+#                         (ssps.sock if there is none, or if it is a .ssps file), one connection at a time, running
+#                         the other files first. Refuses to replace anything but a socket.
+#                    -c : Run with a compiled cache, saving the compiled program next to the input file as a .sspc
+#                         file, and loading it instead of compiling the program again for as long as the input file
+#                         (and the scoping mode) stays the same.
+#                    -O : Run optimized, folding operators on literal operands (like "3 4 add" or "true not") into
+#                         their results, and running if/ifelse on a literal boolean in place, with the same output.
+#                    -t : Run tiered, transpiling each code array that has run 50 times into Python, turning every
+#                         run of literals and stack, arithmetic, comparison and boolean operators in it into a single
+#                         Python function, with the same output (and the same errors). Ignored with -x, -p or -j.
+#                    -m : Run memoized, remembering the results of the last 4096 calls to pure procedures (ones that
+#                         only turn operands into results, using literals, stack, arithmetic, comparison and boolean
+#                         operators, if/ifelse and other pure procedures, with no def or output) on their operands,
+#                         with the same output. With -p or -j, also prints how many calls hit and missed.
+#                    -f : Run fused, replacing common sequences of instructions in code arrays (like "dup mul",
+#                         "1 sub", "exch sub", "0 eq {...} {...} ifelse" or "/x exch def") with single
+#                         superinstructions, with the same output (and the same errors). The superinstructions are
+#                         chosen from any profile printed by -j passed in as a .json filename argument, or are all of
+#                         them if there is none. Ignored with -x, -t, -p or -j.
+#                    -p : Run with the profiler, printing a table of the calls and the cumulative and self time of
+#                         every operator and procedure, slowest first, the deepest the operand and dictionary
+#                         stacks got, and how often the instructions of each superinstruction (see -f) ran, to stderr
+#                         once the program is done.
+#                    -j : Like -p, but print the profile as JSON.
+#                    -q : Like -p (or with -j), but sample: count every operator and procedure call, and only read
+#                         the clock at every 16th one, estimating operator times from the ones timed and charging the
+#                         time since the last reading to the procedures running then, which keeps the profiler cheap
+#                         enough to leave on.
+#
+#             Scoping: A procedure called as the last thing a procedure (or an if body in it) does runs in
+#                      constant space, sharing its caller's dictionary when the caller's definitions are in its scope
+#                      anyway, and replacing it otherwise. So the dictionary stack printed by "stack" and with an
+#                      error only shows the dictionaries of calls with work left to do: under -d,
+#                      "/a { /y 5 def b } def /b { y = stack } def a" prints b's dictionary merged into a's, not
+#                      an empty one of its own on top. Under -s, a procedure's dictionary is linked to the
+#                      dictionary its name was found in by following static links (the one it was defined in),
+#                      rather than the topmost dictionary defining its name.
+#
+# How to embed: Import ssps and create an Interpreter(static, debugging), then call its run(source) method to
+#               interpret a program, using push and pop to pass values in and out. Every Interpreter has its own
+#               stacks, so any number of them can be used in one process. A failing program raises an SSPSError
+#               (StackUnderflowError, OperandTypeError, UndefinedNameError or DivisionByZeroError), leaving the
+#               stacks as they were for inspection until unwind() is called or the next run starts. Output is
+#               buffered and goes to stdout, unless the Interpreter is given another output=OutputSink(file),
+#               like OutputSink(io.StringIO()) to keep it in memory.
+
+import contextlib
+import hashlib
+import io
+import json
+import marshal
+import mmap
+import operator
+import os
+import re
+import socket
+import stat
+import struct
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 
-# -------------------------\
-# Operand Stack Operations |
-# -------------------------/
+# -------\
+# Errors |
+# -------/
 
 
-def op_push(operand):
+class SSPSError(Exception):
     """
-    Push operand onto the operand stack.
-    Throws an error if the operand is a float.
+    An error in an SSPS program, raised by the operator or function (criminal)
+    that found it, along with a description of the problem (crime)
+    and the offending operands (accomplices).
     """
-    if is_float(operand):
-        error("op_push", "float argument encountered", [operand])
-    op_stack.append(operand)
 
+    def __init__(self, criminal, crime, accomplices=[]):
+        super().__init__("Error in " + criminal + ": " + crime + ".")
+        self.operator = criminal
+        self.message = crime
+        self.operands = accomplices
+
+
+class StackUnderflowError(SSPSError):
+    """
+    Popping from an empty operand or dictionary stack.
+    """
+
+
+class OperandTypeError(SSPSError):
+    """
+    An operand of the wrong type for the operator.
+    """
+
+
+class UndefinedNameError(SSPSError):
+    """
+    Looking up a name that is not defined in the current scope.
+    """
+
+
+class DivisionByZeroError(SSPSError):
+    """
+    Dividing by zero.
+    """
+
+
+def error(criminal, crime, accomplices=[], kind=SSPSError):
+    """
+    Raises an SSPS error of the given kind, see SSPSError.
+    """
+    raise kind(criminal, crime, accomplices)
+
+
+class Interpreter:
+    """
+    An SSPS interpreter with its own operand, dictionary and execution stacks,
+    so any number of programs can be run side by side in one process.
+    Compiled code arrays are shared by every interpreter.
+    """
+    __slots__ = ("op_stack", "dict_stack", "name_index", "scope_stack", "exec_stack", "frame_pool", "static",
+                 "debugging", "optimizing", "profiler", "output",
+                 "tiered", "memo", "superinstructions", "run_depth")
+
+    def __init__(self, static=False, debugging=False, optimizing=False, profiling=False, output=None,
+                 tiered=False, memo_size=0, superinstructions=None):
+        """
+        Creates an interpreter with empty stacks, statically scoped if static,
+        producing debugging output if debugging, running peephole optimized code if optimizing,
+        and recording a Profiler of everything it runs if profiling,
+        timing every operator and procedure call if profiling is True,
+        or only every profiling-th one if it is a number (see Profiler).
+        Everything it prints goes to the OutputSink output (buffered stdout by default).
+        If tiered, code arrays that run often are transpiled into Python functions (see jit_code),
+        unless debugging or profiling, which need to see every operator.
+        If memo_size isn't 0, the results of up to memo_size calls to pure procedures are memoized (see Memo),
+        unless debugging.
+        If superinstructions is a set of superinstruction names (like DEFAULT_SUPERINSTRUCTIONS), code arrays
+        are fused with them (see fuse_code), unless debugging, profiling or tiered.
+        """
+        self.op_stack = []
+        self.dict_stack = [({}, None)]
+        # Maps each name to the ascending indices of the dictionaries on the dictionary stack defining it.
+        self.name_index = {}
+        # Parallel to the dictionary stack, the memoized static scope of each dictionary.
+        self.scope_stack = [{}]
+        self.exec_stack = []
+        # How deep the dictionary stack was when the last run started (see unwind).
+        self.run_depth = 1
+        # Cleared dictionaries of finished procedure calls, ready for reuse.
+        self.frame_pool = []
+        self.static = static
+        self.debugging = debugging
+        self.optimizing = optimizing
+        self.profiler = Profiler(int(profiling)) if profiling else None
+        self.output = output if output is not None else OutputSink()
+        self.tiered = tiered and not debugging and not profiling
+        self.memo = Memo(memo_size) if memo_size and not debugging else None
+        self.superinstructions = None
+        if superinstructions is not None and not debugging and not profiling and not tiered:
+            self.superinstructions = frozenset(superinstructions)
 
-def op_pop():
-    """
-    Remove and return top of the operand stack.
-    Throws an error if the operand stack is empty.
-    """
-    if is_empty(op_stack):
-        error("op_pop", "empty operand stack")
-    return op_stack.pop()
+    def run(self, source):
+        """
+        Compiles and interprets a string of an SPS program,
+        leaving its results on this interpreter's stacks.
+        Raises an SSPSError if the program fails, leaving the operand and
+        dictionary stacks as they were when it happened, until unwind is called or the next run starts.
+        """
+        self.run_stream(compile_stream(tokenize(source)))
 
+    def run_stream(self, instructions):
+        """
+        Interprets an iterable of top-level instructions (see compile_stream) as they come,
+        leaving its results on this interpreter's stacks.
+        Raises an SSPSError if the program fails, like run.
+        """
+        self.unwind()
+        self.run_depth = len(self.dict_stack)
+        if self.optimizing:
+            instructions = peephole(instructions)
+        base = len(self.exec_stack)
+        try:
+            if self.profiler is not None:
+                self.profiler.run_stream(self, instructions, base)
+                return
+            for (kind, arg) in instructions:
+                if kind == PUSH:
+                    # Compiled literals are never floats, so skip op_push's check.
+                    self.op_stack.append(arg)
+                    continue
+                if kind == OP:
+                    arg(self)
+                else:
+                    self.call_name(arg)
+                self.run_until(base)
+        except SSPSError:
+            del self.exec_stack[base:]
+            raise
+        finally:
+            self.output.flush()
+
+    def unwind(self):
+        """
+        Pops the dictionaries of the procedure calls a failed run was in the middle of,
+        so the stacks are back to the dictionaries the run started in.
+        """
+        while len(self.dict_stack) > self.run_depth:
+            self.frame_pop()
+
+    def push(self, value):
+        """
+        Pushes a value (an integer, boolean, /name or code array) onto the operand stack.
+        A /name may be given as a string starting with a slash.
+        """
+        if is_string(value) and value[:1] == '/':
+            value = make_name(value)
+        self.op_push(value)
+
+    def pop(self):
+        """
+        Removes and returns the top of the operand stack.
+        """
+        return self.op_pop()
+
+    # -------------------------\
+    # Operand Stack Operations |
+    # -------------------------/
+
+    def op_push(self, operand):
+        """
+        Push operand onto the operand stack.
+        Throws an error if the operand is a float.
+        """
+        if is_float(operand):
+            error("op_push", "float argument encountered", [operand], OperandTypeError)
+        self.op_stack.append(operand)
+
+    def op_pop(self):
+        """
+        Remove and return top of the operand stack.
+        Throws an error if the operand stack is empty.
+        """
+        if is_empty(self.op_stack):
+            error("op_pop", "empty operand stack", [], StackUnderflowError)
+        return self.op_stack.pop()
+
+    def op_underflow(self):
+        """
+        Empties the operand stack and throws the error op_pop throws on an empty operand stack.
+        Operators check once up front that there are enough operands rather than on every op_pop,
+        calling this if there aren't, so the stacks end up as if they had popped all they could.
+        """
+        self.op_stack.clear()
+        error("op_pop", "empty operand stack", [], StackUnderflowError)
+
+    def dup_op(self):
+        """
+        Duplicates the top operand on the operand stack.
+        """
+        if self.debugging:
+            self.debug("***dup_op performed***")
+            self.debug("Operand Stack (Before): " + str(self.op_stack)[1:-1])
+        stack = self.op_stack
+        if not stack:
+            self.op_underflow()
+        stack.append(stack[-1])
+        if self.debugging:
+            self.debug("Operand Stack (After): " + str(self.op_stack)[1:-1])
+            self.debug()
+
+    def exch_op(self):
+        """
+        Swaps the top two operands on the operand stack.
+        """
+        if self.debugging:
+            self.debug("***exch_op performed***")
+            self.debug("Operand Stack (Before): " + str(self.op_stack)[1:-1])
+        stack = self.op_stack
+        if len(stack) < 2:
+            self.op_underflow()
+        (stack[-2], stack[-1]) = (stack[-1], stack[-2])
+        if self.debugging:
+            self.debug("Operand Stack (After): " + str(self.op_stack)[1:-1])
+            self.debug()
+
+    def stack_op(self):
+        """
+        Prints contents of operand and dictionary stacks, topmost first.
+        """
+        write = self.output.write
+        write("==============\n")
+
+        for operand in reversed(self.op_stack):
+            write(str(operand) + "\n")
+
+        write("==============\n")
+
+        index = len(self.dict_stack) - 1
+        for (d, link) in reversed(self.dict_stack):
+            if self.static:
+                write("---- " + str(index) + " ---- " + str(link) + " ----\n")
+            else:
+                write("---- " + str(index) + " ---- \n")
+            for (k, v) in d.items():
+                write(str(k) + " [" + str(v) + "]\n")
+            index -= 1
+
+        write("==============\n")
+
+    def top_op(self):
+        """
+        Pops operand off of operand stack and prints it.
+        """
+        self.output.write(str(self.op_pop()) + "\n")
+
+    # ----------------------\
+    # Arithmetic Operations |
+    # ----------------------/
+
+    def add_op(self):
+        """
+        Takes two operands from the operand stack,
+        performs an integer addition operation,
+        and pushes the integer result to the operand stack.
+        Throws an error if any operand is not an integer.
+        """
+        if self.debugging:
+            self.debug("***add_op performed***")
+            self.debug("Operand Stack (Before): " + str(self.op_stack)[1:-1])
+        stack = self.op_stack
+        if len(stack) < 2:
+            self.op_underflow()
+        second = stack.pop()
+        first = stack[-1]
+        if type(first) is int and type(second) is int:
+            stack[-1] = first + second
+        else:
+            stack.pop()
+            error("add_op", "non-int operand encountered", [first, second], OperandTypeError)
+        if self.debugging:
+            self.debug("Operand Stack (After): " + str(self.op_stack)[1:-1])
+            self.debug()
+
+    def sub_op(self):
+        """
+        Takes two operands from the operand stack,
+        performs an integer subtraction operation,
+        and pushes the integer result to the operand stack.
+        Throws an error if any operand is not an integer.
+        """
+        if self.debugging:
+            self.debug("***sub_op performed***")
+            self.debug("Operand Stack (Before): " + str(self.op_stack)[1:-1])
+        stack = self.op_stack
+        if len(stack) < 2:
+            self.op_underflow()
+        second = stack.pop()
+        first = stack[-1]
+        if type(first) is int and type(second) is int:
+            stack[-1] = first - second
+        else:
+            stack.pop()
+            error("sub_op", "non-int operand encountered", [first, second], OperandTypeError)
+        if self.debugging:
+            self.debug("Operand Stack (After): " + str(self.op_stack)[1:-1])
+            self.debug()
+
+    def mul_op(self):
+        """
+        Takes two operands from the operand stack,
+        performs an integer multiplication operation,
+        and pushes the integer result to the operand stack.
+        Throws an error if any operand is not an integer.
+        """
+        if self.debugging:
+            self.debug("***mul_op performed***")
+            self.debug("Operand Stack (Before): " + str(self.op_stack)[1:-1])
+        stack = self.op_stack
+        if len(stack) < 2:
+            self.op_underflow()
+        second = stack.pop()
+        first = stack[-1]
+        if type(first) is int and type(second) is int:
+            stack[-1] = first * second
+        else:
+            stack.pop()
+            error("mul_op", "non-int operand encountered", [first, second], OperandTypeError)
+        if self.debugging:
+            self.debug("Operand Stack (After): " + str(self.op_stack)[1:-1])
+            self.debug()
+
+    def div_op(self):
+        """
+        Takes two operands from the operand stack,
+        performs an integer division operation,
+        and pushes the integer result to the operand stack.
+        Throws an error if any operand is not an integer,
+        or if dividing by zero.
+        """
+        if self.debugging:
+            self.debug("***div_op performed***")
+            self.debug("Operand Stack (Before): " + str(self.op_stack)[1:-1])
+        stack = self.op_stack
+        if len(stack) < 2:
+            self.op_underflow()
+        second = stack.pop()
+        first = stack[-1]
+        if type(first) is int and type(second) is int:
+            if second != 0:
+                stack[-1] = first // second
+            else:
+                stack.pop()
+                error("div_op", "dividing by zero", [first, second], DivisionByZeroError)
+        else:
+            stack.pop()
+            error("div_op", "non-int operand encountered", [first, second], OperandTypeError)
+        if self.debugging:
+            self.debug("Operand Stack (After): " + str(self.op_stack)[1:-1])
+            self.debug()
+
+    # ----------------------\
+    # Comparison Operations |
+    # ----------------------/
+
+    def eq_op(self):
+        """
+        Takes two operands from the operand stack,
+        performs an integer or boolean equality comparison,
+        and pushes the boolean result to the operand stack.
+        Throws an error if the operands are not either
+        both booleans or both integers.
+        """
+        if self.debugging:
+            self.debug("***eq_op performed***")
+            self.debug("Operand Stack (Before): " + str(self.op_stack)[1:-1])
+        stack = self.op_stack
+        if len(stack) < 2:
+            self.op_underflow()
+        second = stack.pop()
+        first = stack[-1]
+        if type(first) is type(second) and (type(first) is int or type(first) is bool):
+            stack[-1] = first == second
+        else:
+            stack.pop()
+            error("eq_op", "non-matching operand types encountered", [first, second], OperandTypeError)
+        if self.debugging:
+            self.debug("Operand Stack (After): " + str(self.op_stack)[1:-1])
+            self.debug()
+
+    def lt_op(self):
+        """
+        Takes two operands from the operand stack,
+        performs an integer less-than comparison,
+        and pushes the boolean result to the operand stack.
+        Throws an error if any operand is not an integer.
+        """
+        if self.debugging:
+            self.debug("***lt_op performed***")
+            self.debug("Operand Stack (Before): " + str(self.op_stack)[1:-1])
+        stack = self.op_stack
+        if len(stack) < 2:
+            self.op_underflow()
+        second = stack.pop()
+        first = stack[-1]
+        if type(first) is int and type(second) is int:
+            stack[-1] = first < second
+        else:
+            stack.pop()
+            error("lt_op", "non-int operand encountered", [first, second], OperandTypeError)
+        if self.debugging:
+            self.debug("Operand Stack (After): " + str(self.op_stack)[1:-1])
+            self.debug()
+
+    def gt_op(self):
+        """
+        Takes two operands from the operand stack,
+        performs an integer greater-than comparison,
+        and pushes the boolean result to the operand stack.
+        Throws an error if any operand is not an integer.
+        """
+        if self.debugging:
+            self.debug("***gt_op performed***")
+            self.debug("Operand Stack (Before): " + str(self.op_stack)[1:-1])
+        stack = self.op_stack
+        if len(stack) < 2:
+            self.op_underflow()
+        second = stack.pop()
+        first = stack[-1]
+        if type(first) is int and type(second) is int:
+            stack[-1] = first > second
+        else:
+            stack.pop()
+            error("gt_op", "non-int operand encountered", [first, second], OperandTypeError)
+        if self.debugging:
+            self.debug("Operand Stack (After): " + str(self.op_stack)[1:-1])
+            self.debug()
+
+    # -------------------\
+    # Boolean Operations |
+    # -------------------/
+
+    def and_op(self):
+        """
+        Takes two operands from the operand stack,
+        performs a boolean 'and' operation,
+        and pushes the boolean result to the operand stack.
+        Throws an error if any operand is not a boolean.
+        """
+        if self.debugging:
+            self.debug("***and_op performed***")
+            self.debug("Operand Stack (Before): " + str(self.op_stack)[1:-1])
+        stack = self.op_stack
+        if len(stack) < 2:
+            self.op_underflow()
+        second = stack.pop()
+        first = stack[-1]
+        if type(first) is bool and type(second) is bool:
+            stack[-1] = first and second
+        else:
+            stack.pop()
+            error("and_op", "non-bool operand encountered", [first, second], OperandTypeError)
+        if self.debugging:
+            self.debug("Operand Stack (After): " + str(self.op_stack)[1:-1])
+            self.debug()
+
+    def or_op(self):
+        """
+        Takes two operands from the operand stack,
+        performs a boolean 'or' operation,
+        and pushes the boolean result to the operand stack.
+        Throws an error if any operand is not a boolean.
+        """
+        if self.debugging:
+            self.debug("***or_op performed***")
+            self.debug("Operand Stack (Before): " + str(self.op_stack)[1:-1])
+        stack = self.op_stack
+        if len(stack) < 2:
+            self.op_underflow()
+        second = stack.pop()
+        first = stack[-1]
+        if type(first) is bool and type(second) is bool:
+            stack[-1] = first or second
+        else:
+            stack.pop()
+            error("or_op", "non-bool operand encountered", [first, second], OperandTypeError)
+        if self.debugging:
+            self.debug("Operand Stack (After): " + str(self.op_stack)[1:-1])
+            self.debug()
+
+    def not_op(self):
+        """
+        Takes one operand from the operand stack,
+        performs a boolean 'not' operation,
+        and pushes the boolean result to the operand stack.
+        Throws an error if the operand is not a boolean.
+        """
+        if self.debugging:
+            self.debug("***not_op performed***")
+            self.debug("Operand Stack (Before): " + str(self.op_stack)[1:-1])
+        stack = self.op_stack
+        if not stack:
+            self.op_underflow()
+        value = stack[-1]
+        if type(value) is bool:
+            stack[-1] = not value
+        else:
+            stack.pop()
+            error("not_op", "non-bool operand encountered", [value], OperandTypeError)
+        if self.debugging:
+            self.debug("Operand Stack (After): " + str(self.op_stack)[1:-1])
+            self.debug()
+
+    # -------------\
+    # Conditionals |
+    # -------------/
+
+    def if_op(self):
+        """
+        Takes a boolean and a code array from the operand stack,
+        and only interprets the code array if the boolean is True.
+        """
+        if self.debugging:
+            self.debug("***if_op performed***")
+            self.debug("Operand Stack (Before): " + str(self.op_stack)[1:-1])
+        if_code = self.op_pop()
+        boolean = self.op_pop()
+        if is_bool(boolean):
+            if boolean:
+                self.execute(if_code)
+        else:
+            error("if_op", "non-bool operand encountered", [boolean], OperandTypeError)
+        if self.debugging:
+            self.debug("Operand Stack (After): " + str(self.op_stack)[1:-1])
+            self.debug()
+
+    def if_else_op(self):
+        """
+        Takes a boolean and two code arrays from the stack,
+        only interprets the first code array if the boolean is True,
+        and only interprets the second code array if the boolean is False.
+        """
+        if self.debugging:
+            self.debug("***if_else_op performed***")
+            self.debug("Operand Stack (Before): " + str(self.op_stack)[1:-1])
+        else_code = self.op_pop()
+        if_code = self.op_pop()
+        boolean = self.op_pop()
+        if is_bool(boolean):
+            if boolean:
+                self.execute(if_code)
+            else:
+                self.execute(else_code)
+        else:
+            error("if_else_op", "non-bool operand encountered", [boolean], OperandTypeError)
+        if self.debugging:
+            self.debug("Operand Stack (After): " + str(self.op_stack)[1:-1])
+            self.debug()
+
+    # ------\
+    # Loops |
+    # ------/
+
+    def loop_body(self, body, loop):
+        """
+        Schedules the code array body to be interpreted as the body of loop (see Loop),
+        in place, in the current dictionary, like an if body.
+        """
+        self.execute(body)
+        self.exec_stack[-1].loop = loop
+
+    def repeat_op(self):
+        """
+        Takes an integer n and a code array from the operand stack,
+        and interprets the code array n times.
+        Throws an error if n is not a non-negative integer or the code array isn't one.
+        """
+        if self.debugging:
+            self.debug("***repeat_op performed***")
+            self.debug("Operand Stack (Before): " + str(self.op_stack)[1:-1])
+        body = self.op_pop()
+        count = self.op_pop()
+        if not is_int(count) or count < 0:
+            error("repeat_op", "non-count operand encountered", [count], OperandTypeError)
+        if not is_code(body):
+            error("repeat_op", "non-code operand encountered", [body], OperandTypeError)
+        if count:
+            self.loop_body(body, Loop(count - 1))
+        if self.debugging:
+            self.debug("Operand Stack (After): " + str(self.op_stack)[1:-1])
+            self.debug()
+
+    def for_op(self):
+        """
+        Takes an initial value, an increment, a limit and a code array from the operand stack,
+        and interprets the code array once for every value from the initial value up to the limit
+        (down to it, if the increment is negative), stepping by the increment,
+        pushing the value onto the operand stack first each time.
+        Throws an error if the numbers aren't integers or the code array isn't one.
+        """
+        if self.debugging:
+            self.debug("***for_op performed***")
+            self.debug("Operand Stack (Before): " + str(self.op_stack)[1:-1])
+        body = self.op_pop()
+        limit = self.op_pop()
+        increment = self.op_pop()
+        initial = self.op_pop()
+        if not (is_int(initial) and is_int(increment) and is_int(limit)):
+            error("for_op", "non-int operand encountered", [initial, increment, limit], OperandTypeError)
+        if not is_code(body):
+            error("for_op", "non-code operand encountered", [body], OperandTypeError)
+        if (initial <= limit) if increment >= 0 else (initial >= limit):
+            self.op_stack.append(initial)
+            self.loop_body(body, Loop(None, initial, increment, limit))
+        if self.debugging:
+            self.debug("Operand Stack (After): " + str(self.op_stack)[1:-1])
+            self.debug()
+
+    def loop_op(self):
+        """
+        Takes a code array from the operand stack, and interprets it over and over until it exits (see exit_op).
+        Throws an error if the code array isn't one.
+        """
+        if self.debugging:
+            self.debug("***loop_op performed***")
+            self.debug("Operand Stack (Before): " + str(self.op_stack)[1:-1])
+        body = self.op_pop()
+        if not is_code(body):
+            error("loop_op", "non-code operand encountered", [body], OperandTypeError)
+        self.loop_body(body, Loop(None))
+        if self.debugging:
+            self.debug("Operand Stack (After): " + str(self.op_stack)[1:-1])
+            self.debug()
+
+    def exit_op(self):
+        """
+        Stops the innermost repeat, for or loop being interpreted, abandoning the rest of its body
+        along with any procedure calls and if bodies it is in the middle of.
+        Throws an error if there is no loop to stop.
+        """
+        if self.debugging:
+            self.debug("***exit_op performed***")
+        exec_stack = self.exec_stack
+        i = len(exec_stack) - 1
+        while i >= 0 and exec_stack[i].loop is None:
+            i -= 1
+        if i < 0:
+            error("exit_op", "no loop to exit")
+        while len(exec_stack) > i:
+            cont = exec_stack.pop()
+            if cont.frame:
+                self.frame_pop()
+            if cont.profile is not None:
+                self.profiler.finish_call(cont.profile)
+        # Carry on after the loop, handing it an empty code array so the current one is dropped.
+        exec_stack.append(Continuation(EMPTY_CODE, False))
+
+    # ----------------------\
+    # Dictionary Operations |
+    # ----------------------/
+
+    def is_in_dict(self, d, name):
+        """
+        Checks if the dictionary d contains the key name.
+        Returns True if the key is found, False otherwise.
+        """
+        return name in d
+
+    def get_from_dict(self, d, name):
+        """
+        Returns the value associated with the key name in dictionary d.
+        Throws an error if key does not exist in d.
+        """
+        if self.is_in_dict(d, name):
+            return d[name]
+        # May be unnecessary to ever throw this error, but why not just in case.
+        error("get_from_dict", "name not found", [name], UndefinedNameError)
+
+    def add_to_dict(self, d, name, value):
+        """
+        Adds the name-value association pair to dictionary d.
+        """
+        d[name] = value
+
+    # ----------------------------\
+    # Dictionary Stack Operations |
+    # ----------------------------/
+
+    def index_name(self, name, index):
+        """
+        Records in the name index that the dictionary at index defines name.
+        The name index maps each name to the ascending indices of the dictionaries
+        on the dictionary stack that define it, so the last one is the topmost.
+        """
+        if name in self.name_index:
+            self.name_index[name].append(index)
+        else:
+            self.name_index[name] = [index]
+
+    def unindex_name(self, name):
+        """
+        Removes the topmost dictionary defining name from the name index.
+        """
+        indices = self.name_index[name]
+        indices.pop()
+        if is_empty(indices):
+            del self.name_index[name]
+
+    def dict_pop(self):
+        """
+        Remove and return top of the dictionary stack.
+        Throws an error if the dictionary stack is empty.
+        """
+        if is_empty(self.dict_stack):
+            error("dict_pop", "empty dictionary stack", [], StackUnderflowError)
+        (d, link) = self.dict_stack.pop()
+        scope = self.scope_stack.pop()
+        if scope is not None and len(self.frame_pool) < FRAME_POOL_SIZE:
+            scope.clear()
+            self.frame_pool.append(scope)
+        for name in d:
+            self.unindex_name(name)
+        return (d, link)
+
+    def frame_push(self, link):
+        """
+        Push the dictionary of a procedure call with access link onto the dictionary stack.
+        It starts out as the shared EMPTY_FRAME, since most procedures define nothing,
+        and only gets a dictionary of its own on its first def (see own_frame).
+        """
+        self.dict_stack.append((EMPTY_FRAME, link))
+        self.scope_stack.append(None)
+
+    def frame_pop(self):
+        """
+        Remove the dictionary of a finished procedure call from the dictionary stack,
+        recycling its dictionary for later calls.
+        """
+        (d, link) = self.dict_pop()
+        if d is not EMPTY_FRAME and len(self.frame_pool) < FRAME_POOL_SIZE:
+            d.clear()
+            self.frame_pool.append(d)
+
+    def own_frame(self):
+        """
+        Returns the top dictionary of the dictionary stack, first giving it a dictionary of its own
+        (a recycled one if there is any) if it is still the shared EMPTY_FRAME.
+        """
+        (d, link) = self.dict_stack[-1]
+        if d is EMPTY_FRAME:
+            d = self.frame_pool.pop() if self.frame_pool else {}
+            self.dict_stack[-1] = (d, link)
+        return d
+
+    def def_op(self):
+        """
+        Takes a name and a value from the operand stack,
+        gets the top dictionary d from the dictionary stack,
+        and adds the name-value association to d in place.
+        Throws an error if the name is formatted incorrectly.
+        """
+        if self.debugging:
+            self.debug("***def_op performed***")
+            self.debug("Operand Stack (Before): " + str(self.op_stack)[1:-1])
+            self.debug("Top Dictionary and Link (Before): " + str(self.dict_stack[-1])[1:-1])
+        value = self.op_pop()
+        name = self.op_pop()
+        if type(name) is not Name:
+            error("def_op", "trying to define non-name", [name], OperandTypeError)
+        self.define(name.symbol, value)
+        if self.debugging:
+            self.debug("Operand Stack (After): " + str(self.op_stack)[1:-1])
+            self.debug("Top Dictionary and Link (After): " + str(self.dict_stack[-1])[1:-1])
+            self.debug()
+
+    def define(self, name, value):
+        """
+        Associates the interned identifier name with value in the top dictionary, for def_op.
+        """
+        d = self.own_frame()
+        if not self.is_in_dict(d, name):
+            self.index_name(name, len(self.dict_stack) - 1)
+            # An unmemoized name needs no update (see resolve_static).
+            scope = self.scope_stack[-1]
+            if scope is not None:
+                scope[name] = len(self.dict_stack) - 1
+        self.add_to_dict(d, name, value)
+        if self.memo is not None and len(self.dict_stack) == 1:
+            self.memo.forget(name)
+
+    def get_link(self, name):
+        """
+        Finds the topmost dictionary on the dictionary stack that contains the name,
+        using the name index rather than scanning the dictionary stack.
+        If the name is found in any dictionary, returns the positive index of the
+        dictionary that contains the name.
+        Throws error if the name is not found in any dictionary.
+        """
+        if name not in self.name_index:
+            error("get_link", "name is undefined", [name], UndefinedNameError)
+        return self.name_index[name][-1]
+
+    def resolve_static(self, name, index):
+        """
+        Follows static links from the dictionary at index until a dictionary containing the name is found.
+        Returns the positive index of that dictionary, or None if the name is not found.
+        Each dictionary's answer is memoized in its scope on the scope stack. The dictionaries below a
+        dictionary can't change while it is on the stack (def only affects the top dictionary), so the
+        only way an answer goes stale is a def in the dictionary itself, which def_op takes care of.
+        The chain is walked in a loop, so it can be as long as the dictionary stack.
+        """
+        # The scopes of the dictionaries passed through, which all get the same answer.
+        passed = []
+        found = None
+        while True:
+            scope = self.scope_stack[index]
+            if scope is None:
+                scope = self.scope_stack[index] = self.frame_pool.pop() if self.frame_pool else {}
+            elif name in scope:
+                found = scope[name]
+                break
+            (d, link) = self.dict_stack[index]
+            if self.debugging:
+                self.debug("Current dictionary: " + str(d))
+                self.debug("Static link: " + str(link))
+            if self.is_in_dict(d, name):
+                found = index
+                scope[name] = found
+                break
+            if not is_int(link):
+                return None
+            if index == link:
+                error("lookup", "infinite loop", [name])
+            if self.debugging:
+                self.debug("Following static link to index " + str(link) + "...")
+            passed.append(scope)
+            index = link
+        for scope in passed:
+            scope[name] = found
+        return found
+
+    def lookup_index(self, name):
+        """
+        If the name is found in or below the current scope, returns the positive index
+        of the dictionary that contains it.
+        Follows static links if static, goes top-down if dynamic.
+        Throws error if the name is not found in or below the current scope.
+        """
+        if self.static:
+            index = self.resolve_static(name, len(self.dict_stack) - 1)
+            if self.debugging:
+                self.debug("Following static links, the name \"" + str(name) + "\" was found at index " + str(index))
+            if not is_int(index):
+                error("lookup", "name is undefined in current static scope", [name], UndefinedNameError)
+        else:
+            index = self.get_link(name)
+            if self.debugging:
+                self.debug("Following dynamic links, the name \"" + str(name) + "\" was found at index " + str(index))
+            if not is_int(index):
+                error("lookup", "name is undefined in current dynamic scope", [name], UndefinedNameError)
+        return index
+
+    # ---------------\
+    # Interpretation |
+    # ---------------/
+
+    def call_name(self, name):
+        """
+        Looks up the name and, if the value found is a code array, schedules it
+        to be interpreted in a new dictionary, linked to the dictionary the name
+        was found in if static. Any other value is pushed onto the operand stack.
+        """
+        if self.debugging:
+            self.debug("***Name lookup***")
+            self.debug("Name being looked up: \"" + name + "\"")
+            self.debug("Dictionary stack: " + str(self.dict_stack)[1:-1])
+
+        # lookup name and receive code.
+        index = self.lookup_index(name)
+        code = self.get_from_dict(self.dict_stack[index][0], name)
+
+        if self.debugging:
+            self.debug("Code found: \"" + str(code) + "\"")
+            self.debug()
+
+        # Plain values need no dictionary of their own.
+        if not is_code(code):
+            self.op_stack.append(code)
+            return
+
+        # Reuse the results of an earlier call to a pure procedure on the same operands.
+        record = None
+        if self.memo is not None and index == 0:
+            record = self.memo.recall(self, name, code)
+            if record is True:
+                return
+
+        # Create dummy link if dynamic.
+        # Using scientific number of the beast for the lols.
+        link = 666
+        if self.static:
+            # Link to the dictionary the name was found in if static,
+            # which is the one the procedure was defined in.
+            link = index
+
+            if self.debugging:
+                self.debug("***Getting Link***")
+                self.debug("Link made: index " + str(link))
+                self.debug()
+
+        # Interpret the code received once the current instruction is done.
+        self.frame_push(link)
+        self.execute(code, True)
+        if record is not None:
+            self.exec_stack[-1].memo = [record]
+
+    def execute(self, code, frame=False):
+        """
+        Schedules a code array (or a string of an SPS program, which gets compiled first)
+        to be interpreted next by pushing it onto the execution stack.
+        If frame is True, the top dictionary is popped once the code array is done.
+        """
+        if not is_code(code):
+            code = compile_code(str(code))
+        if self.optimizing:
+            code = code.optimized or optimize_code(code)
+        if self.superinstructions is not None:
+            code = fuse_code(code, self.superinstructions)
+        if self.tiered:
+            if code.jitted is not None:
+                code = code.jitted
+            else:
+                code.calls += 1
+                if code.calls >= JIT_THRESHOLD:
+                    code = jit_code(code)
+        if self.debugging:
+            self.debug("=======================Interpreting Code=======================")
+            self.debug("Code: \"" + str(code) + "\"")
+            self.debug("Operand stack: " + str(self.op_stack)[1:-1])
+            self.debug("Dictionary stack: " + str(self.dict_stack)[1:-1])
+            self.debug("Top dictionary: " + str(self.dict_stack[-1])[1:-1])
+            self.debug()
+        self.exec_stack.append(Continuation(code, frame))
+
+    def eliminate_tail_call(self, base):
+        """
+        Removes the finished continuations right below the newly scheduled one (down to base),
+        handing their dictionary over to the new continuation where scoping allows,
+        so tail calls and tail if/ifelse bodies run in constant space.
+        A procedure called in tail position shares its caller's dictionary when the caller's
+        dictionary is in its scope anyway (always if dynamic, if it is the static link if static),
+        and otherwise gets a fresh dictionary in place of its caller's.
+        If static, a caller's dictionary that defines anything is only ever replaced, never shared,
+        so the procedure's defs can't overwrite definitions other procedures still see.
+        """
+        new = self.exec_stack[-1]
+        # An if/ifelse body carries on the call it finishes, so its time is still charged to the procedure.
+        branch = not new.frame
+        while len(self.exec_stack) > base + 1:
+            done = self.exec_stack[-2]
+            if done.pc < len(done.code.instructions) or done.loop is not None:
+                break
+            if done.frame:
+                if not new.frame:
+                    # An if/ifelse body simply runs on in the finished code's dictionary.
+                    new.frame = True
+                else:
+                    link = self.dict_stack[-1][1]
+                    caller = len(self.dict_stack) - 2
+                    if self.static and link == caller and self.dict_stack[caller][0]:
+                        # The procedure is linked to its caller's definitions, so they must stay put.
+                        break
+                    if self.debugging:
+                        self.debug("***Tail call***")
+                    self.frame_pop()
+                    if self.static and link != len(self.dict_stack) - 1:
+                        self.frame_pop()
+                        self.frame_push(link)
+            del self.exec_stack[-2]
+            if done.profile is not None:
+                if branch and new.profile is None:
+                    new.profile = done.profile
+                else:
+                    self.profiler.tail_call(done.profile, new.profile)
+            if done.memo is not None:
+                # The new continuation finishes the call for it. Only the outermost call is remembered,
+                # so a chain of tail calls stays in constant space.
+                new.memo = done.memo
+
+    def run_until(self, base):
+        """
+        Interprets the code arrays on the execution stack until it is back down to base.
+        Procedure calls and conditionals push their code onto the execution stack rather
+        than recursing, so SSPS recursion is not bounded by Python's recursion limit.
+        """
+        while len(self.exec_stack) > base:
+            cont = self.exec_stack[-1]
+            instructions = cont.code.instructions
+            pc = cont.pc
+            end = len(instructions)
+            while pc < end:
+                (kind, arg) = instructions[pc]
+                pc += 1
+                if kind == PUSH:
+                    # Compiled literals are never floats, so skip op_push's check.
+                    self.op_stack.append(arg)
+                    continue
+                if kind == OP:
+                    arg(self)
+                else:
+                    self.call_name(arg)
+                # Switch to any code array the instruction scheduled.
+                if self.exec_stack[-1] is not cont:
+                    break
+            cont.pc = pc
+            if self.exec_stack[-1] is cont:
+                if cont.loop is not None and cont.loop.again(self):
+                    # Run the loop body again, in place.
+                    cont.pc = 0
+                    continue
+                self.exec_stack.pop()
+                if cont.frame:
+                    self.frame_pop()
+                if cont.memo is not None:
+                    self.memo.remember(self, cont.memo)
+            elif pc == end:
+                # The last instruction scheduled the new code array, so it is a tail call.
+                self.eliminate_tail_call(base)
+
+    # ---------------------\
+    # Debugging and Errors |
+    # ---------------------/
+
+    def debug(self, message="", sep=" ", end="\n"):
+        """
+        Debugging output, only prints if debugging is enabled.
+        Callers check the debugging flag themselves before building any message,
+        so that the stacks are never stringified when debugging is off.
+        """
+        if self.debugging:
+            self.output.write(str(message) + " " + sep + " " + end + "\n")
+
+    def report(self, err):
+        """
+        Prints a semi-detailed message for the SSPS error err,
+        along with the operand and dictionary stacks as they were when it happened (topmost first),
+        and flushes the output.
+        """
+        write = self.output.write
+        write(str(err) + "\n")
+        if err.operands != []:
+            write("Problem Arguments:  " + str(err.operands)[1:-1] + "\n")
+        write("SPS Operand Stack:  " + str(self.op_stack[::-1])[1:-1] + "\n")
+        write("SPS Dictionary Stack:  " + str(self.dict_stack[::-1])[1:-1] + "\n")
+        self.output.flush()
+
+
+# ------------------\
+# Operator Registry |
+# ------------------/
+
+
+# Instruction kinds.
+PUSH = 0
+OP = 1
+NAME = 2
+
+# Maps operator names to the handler performing them.
+operators = {
+    "add": Interpreter.add_op,
+    "sub": Interpreter.sub_op,
+    "mul": Interpreter.mul_op,
+    "div": Interpreter.div_op,
+    "eq": Interpreter.eq_op,
+    "lt": Interpreter.lt_op,
+    "gt": Interpreter.gt_op,
+    "and": Interpreter.and_op,
+    "or": Interpreter.or_op,
+    "not": Interpreter.not_op,
+    "if": Interpreter.if_op,
+    "ifelse": Interpreter.if_else_op,
+    "dup": Interpreter.dup_op,
+    "exch": Interpreter.exch_op,
+    "stack": Interpreter.stack_op,
+    "=": Interpreter.top_op,
+    "pop": Interpreter.op_pop,
+    "def": Interpreter.def_op,
+    "repeat": Interpreter.repeat_op,
+    "for": Interpreter.for_op,
+    "loop": Interpreter.loop_op,
+    "exit": Interpreter.exit_op,
+}
 
-def dup_op():
-    """
-    Duplicates the top operand on the operand stack.
+
+def register_operator(name, handler):
     """
-    debug("***dup_op performed***")
-    debug("Operand Stack (Before): " + str(op_stack)[1:-1])
-    val = op_pop()
-    dup = val
-    op_push(val)
-    op_push(dup)
-    debug("Operand Stack (After): " + str(op_stack)[1:-1])
-    debug()
+    Adds (or replaces) the operator name, performed by calling handler with the interpreter.
+    Clears the code cache, since code compiled earlier may treat name as a name lookup.
+    """
+    operators[name] = handler
+    code_cache.clear()
 
 
-def exch_op():
-    """
-    Swaps the top two operands on the operand stack.
-    """
-    debug("***exch_op performed***")
-    debug("Operand Stack (Before): " + str(op_stack)[1:-1])
-    second = op_pop()
-    first = op_pop()
-    op_push(second)
-    op_push(first)
-    debug("Operand Stack (After): " + str(op_stack)[1:-1])
-    debug()
+# ------------\
+# Code Arrays |
+# ------------/
 
 
-def stack_op():
+class CodeArray:
     """
-    Prints contents of operand and dictionary stacks.
+    An immutable, pre-compiled code array.
+    Holds the source text of the code array (without curly braces) and its instructions,
+    where any nested code arrays are already compiled into CodeArrays themselves.
+    Prints as its source text so the stacks look the same as plain code strings.
+    Its optimized version (see optimize_code) is filled in the first time it is needed,
+    and its transpiled version (see jit_code) once it has run JIT_THRESHOLD times.
+    Its fused version (see fuse_code) is kept along with the superinstructions it was fused with.
     """
-    print("==============")
-
-    op_stack.reverse()
-    for operand in op_stack:
-        print(operand)
-    op_stack.reverse()
+    __slots__ = ("source", "instructions", "optimized", "calls", "jitted", "fused")
 
-    print("==============")
+    def __init__(self, source, instructions):
+        self.source = source
+        self.instructions = tuple(instructions)
+        self.optimized = None
+        self.calls = 0
+        self.jitted = None
+        self.fused = None
 
-    dict_stack.reverse()
-    index = len(dict_stack) - 1
-    for (d, link) in dict_stack:
-        print("----", index, "---- ", end="")
-        if static:
-            print(link, "----", end="")
-        print()
-        for (k, v) in d.items():
-            print(k, " [", v, "]", sep="")
-        index -= 1
-    dict_stack.reverse()
+    def __str__(self):
+        return self.source
 
-    print("==============")
+    def __repr__(self):
+        return repr(self.source)
 
 
-def top_op():
+class Name:
     """
-    Pops operand off of operand stack and prints it.
+    A /name literal, kept apart from code arrays, integers and booleans by its type alone.
+    Names are interned by make_name, so each /name exists only once,
+    and carry the symbol (see symbol) they define, worked out once.
+    Prints as its text (including the slash) so the stacks look the same as plain /name strings.
     """
-    print(op_pop())
+    __slots__ = ("text", "symbol")
 
+    def __init__(self, text):
+        self.text = text
+        self.symbol = symbol(text[1:])
 
-# ----------------------\
-# Arithmetic Operations |
-# ----------------------/
+    def __str__(self):
+        return self.text
 
+    def __repr__(self):
+        return repr(self.text)
 
-def add_op():
+
+def symbol(identifier):
     """
-    Takes two operands from the operand stack,
-    performs an integer addition operation,
-    and pushes the integer result to the operand stack.
-    Throws an error if any operand is not an integer.
+    Returns the symbol for an identifier: the one interned string with its text.
+    Dictionaries are keyed by symbols, and name lookups carry symbols, so looking a name up
+    compares the same string object (with its hash computed once) rather than equal copies.
     """
-    debug("***add_op performed***")
-    debug("Operand Stack (Before): " + str(op_stack)[1:-1])
-    second = op_pop()
-    first = op_pop()
-    if is_int(first) and is_int(second):
-        op_push(first + second)
-    else:
-        error("add_op", "non-int operand encountered", [first, second])
-    debug("Operand Stack (After): " + str(op_stack)[1:-1])
-    debug()
+    return sys.intern(identifier)
 
 
-def sub_op():
-    """
-    Takes two operands from the operand stack,
-    performs an integer subtraction operation,
-    and pushes the integer result to the operand stack.
-    Throws an error if any operand is not an integer.
-    """
-    debug("***sub_op performed***")
-    debug("Operand Stack (Before): " + str(op_stack)[1:-1])
-    second = op_pop()
-    first = op_pop()
-    if is_int(first) and is_int(second):
-        op_push(first - second)
-    else:
-        error("sub_op", "non-int operand encountered", [first, second])
-    debug("Operand Stack (After): " + str(op_stack)[1:-1])
-    debug()
+# Every /name created so far, keyed by its text.
+name_table = {}
 
 
-def mul_op():
+def make_name(text):
     """
-    Takes two operands from the operand stack,
-    performs an integer multiplication operation,
-    and pushes the integer result to the operand stack.
-    Throws an error if any operand is not an integer.
+    Returns the interned Name for the /name text, creating it if necessary.
     """
-    debug("***mul_op performed***")
-    debug("Operand Stack (Before): " + str(op_stack)[1:-1])
-    second = op_pop()
-    first = op_pop()
-    if is_int(first) and is_int(second):
-        op_push(first * second)
-    else:
-        error("mul_op", "non-int operand encountered", [first, second])
-    debug("Operand Stack (After): " + str(op_stack)[1:-1])
-    debug()
-
-
-def div_op():
-    """
-    Takes two operands from the operand stack,
-    performs an integer division operation,
-    and pushes the integer result to the operand stack.
-    Throws an error if any operand is not an integer,
-    or if dividing by zero.
-    """
-    debug("***div_op performed***")
-    debug("Operand Stack (Before): " + str(op_stack)[1:-1])
-    second = op_pop()
-    first = op_pop()
-    if is_int(first) and is_int(second):
-        if second != 0:
-            op_push(first // second)
-        else:
-            error("div_op", "dividing by zero", [first, second])
-    else:
-        error("div_op", "non-int operand encountered", [first, second])
-    debug("Operand Stack (After): " + str(op_stack)[1:-1])
-    debug()
+    name = name_table.get(text)
+    if name is None:
+        name = Name(text)
+        name_table[text] = name
+    return name
 
 
-# ----------------------\
-# Comparison Operations |
-# ----------------------/
+# The most code arrays the code cache keeps (see cached_code).
+CODE_CACHE_SIZE = 4096
 
+# The code arrays compiled most recently, keyed by their source text, least recently used first.
+code_cache = OrderedDict()
 
-def eq_op():
-    """
-    Takes two operands from the operand stack,
-    performs an integer or boolean equality comparison,
-    and pushes the boolean result to the operand stack.
-    Throws an error if the operands are not either
-    both booleans or both integers.
-    """
-    debug("***eq_op performed***")
-    debug("Operand Stack (Before): " + str(op_stack)[1:-1])
-    second = op_pop()
-    first = op_pop()
-    if is_int(first) and is_int(second):
-        op_push(first == second)
-    elif is_bool(first) and is_bool(second):
-        op_push(first == second)
-    else:
-        error("eq_op", "non-matching operand types encountered", [first, second])
-    debug("Operand Stack (After): " + str(op_stack)[1:-1])
-    debug()
+# Comments run to the end of their line.
+TOKEN_PATTERN = re.compile("/?[a-zA-Z][a-zA-Z0-9_]*|[-]?[0-9]+|[}{]|%[^\n]*|[^ \t\r\n]")
+BYTES_TOKEN_PATTERN = re.compile(b"/?[a-zA-Z][a-zA-Z0-9_]*|[-]?[0-9]+|[}{]|%[^\n]*|[\x80-\xff]+|[^ \t\r\n]")
 
 
-def lt_op():
+def tokenize(code):
     """
-    Takes two operands from the operand stack,
-    performs an integer less-than comparison,
-    and pushes the boolean result to the operand stack.
-    Throws an error if any operand is not an integer.
+    Lazily splits a code string into SSPS tokens, skipping comments.
+    Curly braces are always separate tokens.
     """
-    debug("***lt_op performed***")
-    debug("Operand Stack (Before): " + str(op_stack)[1:-1])
-    second = op_pop()
-    first = op_pop()
-    if is_int(first) and is_int(second):
-        op_push(first < second)
-    else:
-        error("lt_op", "non-int operand encountered", [first, second])
-    debug("Operand Stack (After): " + str(op_stack)[1:-1])
-    debug()
+    for match in TOKEN_PATTERN.finditer(code):
+        token = match.group()
+        if token[0] != '%':
+            yield token
 
 
-def gt_op():
+def read_tokens(filename):
     """
-    Takes two operands from the operand stack,
-    performs an integer greater-than comparison,
-    and pushes the boolean result to the operand stack.
-    Throws an error if any operand is not an integer.
+    Lazily tokenizes the SSPS program in the file filename like tokenize,
+    memory-mapping the file instead of reading it into one string,
+    so memory stays bounded no matter how big the program is.
+    Throws an error if the file can't be read.
     """
-    debug("***gt_op performed***")
-    debug("Operand Stack (Before): " + str(op_stack)[1:-1])
-    second = op_pop()
-    first = op_pop()
-    if is_int(first) and is_int(second):
-        op_push(first > second)
-    else:
-        error("gt_op", "non-int operand encountered", [first, second])
-    debug("Operand Stack (After): " + str(op_stack)[1:-1])
-    debug()
+    try:
+        source = open(filename, "rb")
+    except IOError:
+        error("reading file", "file does not exist", [filename])
+    with source:
+        if os.fstat(source.fileno()).st_size == 0:
+            return
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for match in BYTES_TOKEN_PATTERN.finditer(mapped):
+                token = match.group()
+                if token[0] != ord('%'):
+                    yield token.decode("utf-8", "replace")
+
+
+def classify(token):
+    """
+    Classifies a single token into an instruction, a (kind, argument) pair.
+    Operators become OP instructions carrying their handler,
+    booleans, integers and /names become PUSH instructions carrying the value,
+    and anything else becomes a NAME instruction carrying the name to look up.
+    """
+    if token in operators:
+        return (OP, operators[token])
+    if token == "true":
+        return (PUSH, True)
+    if token == "false":
+        return (PUSH, False)
+    try:
+        return (PUSH, int(token))
+    except ValueError:
+        pass
+    if token[0] == '/':
+        return (PUSH, make_name(token))
+    return (NAME, symbol(token))
 
 
-# -------------------\
-# Boolean Operations |
-# -------------------/
+def compile_array(tokens):
+    """
+    Compiles tokens up to the '}' closing an already opened code array into a CodeArray,
+    compiling nested code arrays along the way.
+    Code arrays with the same source text share the same cached CodeArray.
+    Returns None if the code array is never closed.
+    """
+    # Each level holds the raw tokens (for the source text) and instructions of an open code array.
+    levels = [([], [])]
+    for token in tokens:
+        if token == '{':
+            levels.append(([], []))
+        elif token == '}':
+            (raw, instructions) = levels.pop()
+            code_arr = cached_code(" ".join(raw), instructions)
+            if not levels:
+                return code_arr
+            levels[-1][0].append('{')
+            levels[-1][0].extend(raw)
+            levels[-1][0].append('}')
+            levels[-1][1].append((PUSH, code_arr))
+        else:
+            levels[-1][0].append(token)
+            levels[-1][1].append(classify(token))
+    return None
 
 
-def and_op():
+def compile_stream(tokens):
     """
-    Takes two operands from the operand stack,
-    performs a boolean 'and' operation,
-    and pushes the boolean result to the operand stack.
-    Throws an error if any operand is not a boolean.
+    Lazily compiles an iterable of tokens, yielding each outermost instruction as soon as it is complete,
+    so a program can start running before all of it has been read.
+    Unterminated code arrays are dropped, just like the program never finished them.
     """
-    debug("***and_op performed***")
-    debug("Operand Stack (Before): " + str(op_stack)[1:-1])
-    second = op_pop()
-    first = op_pop()
-    if is_bool(first) and is_bool(second):
-        op_push(first and second)
-    else:
-        error("and_op", "non-bool operand encountered", [first, second])
-    debug("Operand Stack (After): " + str(op_stack)[1:-1])
-    debug()
+    tokens = iter(tokens)
+    for token in tokens:
+        if token == '{':
+            code_arr = compile_array(tokens)
+            if code_arr is None:
+                return
+            yield (PUSH, code_arr)
+        else:
+            yield classify(token)
 
 
-def or_op():
+def compile_code(code):
     """
-    Takes two operands from the operand stack,
-    performs a boolean 'or' operation,
-    and pushes the boolean result to the operand stack.
-    Throws an error if any operand is not a boolean.
+    Compiles a code string into a CodeArray, once.
+    Outermost code arrays in the code become CodeArray instructions, compiled recursively.
     """
-    debug("***or_op performed***")
-    debug("Operand Stack (Before): " + str(op_stack)[1:-1])
-    second = op_pop()
-    first = op_pop()
-    if is_bool(first) and is_bool(second):
-        op_push(first or second)
-    else:
-        error("or_op", "non-bool operand encountered", [first, second])
-    debug("Operand Stack (After): " + str(op_stack)[1:-1])
-    debug()
+    return cached_code(code, compile_stream(tokenize(code)))
 
 
-def not_op():
+def cached_code(source, instructions):
     """
-    Takes one operand from the operand stack,
-    performs a boolean 'not' operation,
-    and pushes the boolean result to the operand stack.
-    Throws an error if the operand is not a boolean.
+    Returns the cached CodeArray with the source text source,
+    creating it from instructions (an iterable, only consumed if need be) and caching it if necessary.
+    Only the CODE_CACHE_SIZE most recently used code arrays are kept, so memory stays bounded
+    however many distinct code arrays a program has.
     """
-    debug("***not_op performed***")
-    debug("Operand Stack (Before): " + str(op_stack)[1:-1])
-    value = op_pop()
-    if is_bool(value):
-        op_push(not value)
+    code_arr = code_cache.get(source)
+    if code_arr is None:
+        code_arr = CodeArray(source, instructions)
+        code_cache[source] = code_arr
+        if len(code_cache) > CODE_CACHE_SIZE:
+            code_cache.popitem(last=False)
     else:
-        error("not_op", "non-bool operand encountered", [value])
-    debug("Operand Stack (After): " + str(op_stack)[1:-1])
-    debug()
+        code_cache.move_to_end(source)
+    return code_arr
 
 
-# -------------\
-# Conditionals |
-# -------------/
+# ----------\
+# Optimizer |
+# ----------/
 
 
-def if_op():
+# The most literal pushes the peephole optimizer ever needs to fold an operator (for ifelse).
+FOLD_WINDOW = 3
+
+
+def fold_binary(pending, operation, check):
     """
-    Takes a boolean and a code array from the operand stack,
-    and only interprets the code array if the boolean is True.
+    Folds a binary operator over the last two pending literals if check accepts them,
+    replacing them with the literal result. Returns True if folded, False if not.
     """
-    debug("***if_op performed***")
-    debug("Operand Stack (Before): " + str(op_stack)[1:-1])
-    if_code = op_pop()
-    boolean = op_pop()
-    if is_bool(boolean):
-        if boolean:
-            interpret(if_code)
-    else:
-        error("if_op", "non-bool operand encountered", [boolean])
-    debug("Operand Stack (After): " + str(op_stack)[1:-1])
-    debug()
+    if len(pending) < 2:
+        return False
+    first = pending[-2][1]
+    second = pending[-1][1]
+    if not check(first, second):
+        return False
+    del pending[-2:]
+    pending.append((PUSH, operation(first, second)))
+    return True
+
+
+def both_int(first, second):
+    return is_int(first) and is_int(second)
+
+
+def both_bool(first, second):
+    return is_bool(first) and is_bool(second)
+
+
+def fold(handler, pending):
+    """
+    Tries to fold the operator performed by handler over the pending literal pushes,
+    exactly as the operator would behave at run time.
+    Operators that would fail are left alone, so they still fail (the same way) at run time.
+    Returns True if folded, the instructions of a code array to run in its place
+    if it is an if/ifelse on literals, or False if it can't be folded.
+    """
+    if handler is Interpreter.add_op:
+        return fold_binary(pending, lambda a, b: a + b, both_int)
+    if handler is Interpreter.sub_op:
+        return fold_binary(pending, lambda a, b: a - b, both_int)
+    if handler is Interpreter.mul_op:
+        return fold_binary(pending, lambda a, b: a * b, both_int)
+    if handler is Interpreter.div_op:
+        return fold_binary(pending, lambda a, b: a // b, lambda a, b: both_int(a, b) and b != 0)
+    if handler is Interpreter.eq_op:
+        return fold_binary(pending, lambda a, b: a == b, lambda a, b: both_int(a, b) or both_bool(a, b))
+    if handler is Interpreter.lt_op:
+        return fold_binary(pending, lambda a, b: a < b, both_int)
+    if handler is Interpreter.gt_op:
+        return fold_binary(pending, lambda a, b: a > b, both_int)
+    if handler is Interpreter.and_op:
+        return fold_binary(pending, lambda a, b: a and b, both_bool)
+    if handler is Interpreter.or_op:
+        return fold_binary(pending, lambda a, b: a or b, both_bool)
+    if handler is Interpreter.not_op:
+        if pending and is_bool(pending[-1][1]):
+            pending[-1] = (PUSH, not pending[-1][1])
+            return True
+        return False
+    if handler is Interpreter.dup_op:
+        if pending:
+            pending.append(pending[-1])
+            return True
+        return False
+    if handler is Interpreter.exch_op:
+        if len(pending) >= 2:
+            pending[-2:] = [pending[-1], pending[-2]]
+            return True
+        return False
+    if handler is Interpreter.op_pop:
+        if pending:
+            pending.pop()
+            return True
+        return False
+    if handler is Interpreter.if_op:
+        if len(pending) >= 2 and is_bool(pending[-2][1]) and is_code(pending[-1][1]):
+            (boolean, if_code) = (pending[-2][1], pending[-1][1])
+            del pending[-2:]
+            return if_code.instructions if boolean else True
+        return False
+    if handler is Interpreter.if_else_op:
+        if len(pending) >= 3 and is_bool(pending[-3][1]) and is_code(pending[-2][1]) and is_code(pending[-1][1]):
+            (boolean, if_code, else_code) = (pending[-3][1], pending[-2][1], pending[-1][1])
+            del pending[-3:]
+            return if_code.instructions if boolean else else_code.instructions
+        return False
+    return False
+
+
+def peephole(instructions):
+    """
+    Lazily optimizes an iterable of instructions, yielding the optimized instructions:
+    folds operators whose operands are all literals (see fold) into their literal results,
+    which also removes no-op stack shuffles like dup pop and exch exch on literals,
+    and runs the chosen code array of an if/ifelse on a literal boolean in place.
+    Nested code arrays are optimized when they are run, see optimize_code.
+    """
+    # The literal pushes not yet yielded, kept until they can no longer be folded.
+    pending = []
+    # Iterators over the instructions still to optimize, innermost (inlined) last.
+    sources = [iter(instructions)]
+    while sources:
+        instruction = next(sources[-1], None)
+        if instruction is None:
+            sources.pop()
+            continue
+        (kind, arg) = instruction
+        if kind == PUSH:
+            pending.append(instruction)
+            if len(pending) > FOLD_WINDOW:
+                yield pending.pop(0)
+            continue
+        if kind == OP:
+            folded = fold(arg, pending)
+            if folded is True:
+                continue
+            if folded:
+                sources.append(iter(folded))
+                continue
+        yield from pending
+        pending.clear()
+        yield instruction
+    yield from pending
+
+
+def optimize_code(code_arr):
+    """
+    Returns the optimized version of a code array, optimizing it (once) if necessary.
+    The optimized version keeps the same source text, so it prints the same.
+    """
+    if code_arr.optimized is None:
+        optimized = CodeArray(code_arr.source, peephole(code_arr.instructions))
+        optimized.optimized = optimized
+        code_arr.optimized = optimized
+    return code_arr.optimized
+
+
+# -------------------\
+# Tiered Compilation |
+# -------------------/
+
 
+# How many times a code array runs in the interpreter before the tier transpiles it (see jit_code).
+JIT_THRESHOLD = 50
 
-def if_else_op():
+
+# The operators the tier turns into Python expressions, with the type of their operands,
+# the type of their result, and the expression computing it.
+JIT_BINARY = {
+    Interpreter.add_op: (int, int, "%s + %s"),
+    Interpreter.sub_op: (int, int, "%s - %s"),
+    Interpreter.mul_op: (int, int, "%s * %s"),
+    Interpreter.div_op: (int, int, "%s // %s"),
+    Interpreter.lt_op: (int, bool, "%s < %s"),
+    Interpreter.gt_op: (int, bool, "%s > %s"),
+    Interpreter.and_op: (bool, bool, "%s and %s"),
+    Interpreter.or_op: (bool, bool, "%s or %s"),
+}
+JIT_OPERATORS = set(JIT_BINARY) | {Interpreter.eq_op, Interpreter.not_op, Interpreter.dup_op,
+                                   Interpreter.exch_op, Interpreter.op_pop}
+
+
+def fallback(instructions):
     """
-    Takes a boolean and two code arrays from the stack,
-    only interprets the first code array if the boolean is True,
-    and only interprets the second code array if the boolean is False.
+    Returns a function interpreting instructions one at a time,
+    for a transpiled run (or a superinstruction) of them to hand over to when it can't go on.
+    Only the last instruction may schedule a code array.
     """
-    debug("***if_else_op performed***")
-    debug("Operand Stack (Before): " + str(op_stack)[1:-1])
-    else_code = op_pop()
-    if_code = op_pop()
-    boolean = op_pop()
-    if is_bool(boolean):
-        if boolean:
-            interpret(if_code)
+    def interpret(interpreter):
+        stack = interpreter.op_stack
+        for (kind, arg) in instructions:
+            if kind == PUSH:
+                stack.append(arg)
+            elif kind == OP:
+                arg(interpreter)
+            else:
+                interpreter.call_name(arg)
+    return interpret
+
+
+def transpile(instructions, last=None):
+    """
+    Transpiles a run of literal pushes and stack, arithmetic, comparison and boolean operators
+    (see JIT_OPERATORS), followed by the instruction last (if not None) that ends the run,
+    into one Python function doing the same to an interpreter's operand stack,
+    keeping the operands in local variables and only touching the operand stack at the start and end,
+    then performing last. An if/ifelse on literal code arrays as last schedules the right one directly.
+    Wherever an operand might be missing, of the wrong type or a zero divisor, the function checks,
+    and hands the whole run to the interpreter (see fallback) if so, which then fails exactly as it would have.
+    Returns None if the run is sure to fail, leaving it to the interpreter.
+    """
+    body = []
+    constants = {"fallback": fallback(instructions + ([last] if last is not None else []))}
+    # The expression for each value on the operand stack (bottom first), and the type of each expression
+    # (None until checked).
+    stack = []
+    types = {}
+    inputs = 0
+
+    def pop():
+        # Values below the run's own come off the operand stack, a0 being the top.
+        nonlocal inputs
+        if stack:
+            return stack.pop()
+        value = "a" + str(inputs)
+        inputs += 1
+        types[value] = None
+        return value
+
+    def check(value, kind):
+        # Checks value is of type kind. Returns False if it is sure not to be.
+        if types[value] is None:
+            body.append("if type(%s) is not %s: return fallback(interpreter)" % (value, kind.__name__))
+            types[value] = kind
+        return types[value] is kind
+
+    def push(expression, kind):
+        value = "t" + str(len(body))
+        body.append("%s = %s" % (value, expression))
+        types[value] = kind
+        stack.append(value)
+
+    for (kind, arg) in instructions:
+        if kind == PUSH:
+            if is_int(arg) or is_bool(arg):
+                value = repr(arg)
+                types[value] = type(arg)
+            else:
+                value = "c" + str(len(constants))
+                constants[value] = arg
+                types[value] = type(arg)
+            stack.append(value)
+        elif arg in JIT_BINARY:
+            (operand, result, expression) = JIT_BINARY[arg]
+            second = pop()
+            first = pop()
+            if not check(first, operand) or not check(second, operand):
+                return None
+            if arg is Interpreter.div_op:
+                if second == "0":
+                    return None
+                if not second.lstrip("-").isdigit():
+                    body.append("if %s == 0: return fallback(interpreter)" % second)
+            push(expression % (first, second), result)
+        elif arg is Interpreter.eq_op:
+            second = pop()
+            first = pop()
+            known = types[first] or types[second]
+            if known is None:
+                body.append("if type(%s) is not type(%s) or (type(%s) is not int and type(%s) is not bool): "
+                            "return fallback(interpreter)" % (first, second, first, first))
+            elif known not in (int, bool) or not check(first, known) or not check(second, known):
+                return None
+            push("%s == %s" % (first, second), bool)
+        elif arg is Interpreter.not_op:
+            value = pop()
+            if not check(value, bool):
+                return None
+            push("not " + value, bool)
+        elif arg is Interpreter.dup_op:
+            value = pop()
+            stack += [value, value]
+        elif arg is Interpreter.exch_op:
+            second = pop()
+            first = pop()
+            stack += [second, first]
         else:
-            interpret(else_code)
+            pop()
+
+    # Work out how to perform last, once the operand stack is written back.
+    finish = []
+    if last is None:
+        pass
+    elif last[0] == NAME:
+        constants["name"] = last[1]
+        finish.append("interpreter.call_name(name)")
+    elif last[1] is Interpreter.if_op and len(stack) >= 2 and types[stack[-1]] is CodeArray:
+        code = stack.pop()
+        condition = pop()
+        if not check(condition, bool):
+            return None
+        finish.append("if %s: interpreter.execute(%s)" % (condition, code))
+    elif (last[1] is Interpreter.if_else_op and len(stack) >= 3 and types[stack[-1]] is CodeArray
+          and types[stack[-2]] is CodeArray):
+        else_code = stack.pop()
+        if_code = stack.pop()
+        condition = pop()
+        if not check(condition, bool):
+            return None
+        finish.append("interpreter.execute(%s if %s else %s)" % (if_code, condition, else_code))
     else:
-        error("if_else_op", "non-bool operand encountered", [boolean])
-    debug("Operand Stack (After): " + str(op_stack)[1:-1])
-    debug()
+        constants["operator"] = last[1]
+        finish.append("operator(interpreter)")
+
+    lines = ["def run(interpreter):", "    s = interpreter.op_stack"]
+    if inputs:
+        lines.append("    if len(s) < %d: return fallback(interpreter)" % inputs)
+        lines += ["    a%d = s[-%d]" % (i, i + 1) for i in range(inputs)]
+    lines += ["    " + line for line in body]
+    if inputs:
+        lines.append("    s[-%d:] = [%s]" % (inputs, ", ".join(stack)))
+    elif stack:
+        lines.append("    s += [%s]" % ", ".join(stack))
+    lines += ["    " + line for line in finish]
+    source = "\n".join(lines) + "\n"
+    exec(compile(source, "<ssps tier>", "exec"), constants)
+    return constants["run"]
+
+
+def jit_code(code_arr):
+    """
+    Returns the transpiled version of a code array, transpiling it (once) if necessary.
+    Every run of literal pushes and operators transpile handles, along with the name or operator
+    that ends it, becomes a single operator performing the transpiled function.
+    The transpiled version keeps the same source text, so it prints the same.
+    """
+    if code_arr.jitted is None:
+        instructions = []
+        run = []
+        for instruction in code_arr.instructions + (None,):
+            if instruction is not None and (instruction[0] == PUSH or
+                                            (instruction[0] == OP and instruction[1] in JIT_OPERATORS)):
+                run.append(instruction)
+                continue
+            function = None
+            if any(kind == OP for (kind, arg) in run) and len(run) + (instruction is not None) > 1:
+                function = transpile(run, instruction)
+            if function is not None:
+                instructions.append((OP, function))
+            else:
+                instructions += run
+                if instruction is not None:
+                    instructions.append(instruction)
+            run = []
+        jitted = CodeArray(code_arr.source, instructions)
+        jitted.jitted = jitted
+        code_arr.jitted = jitted
+    return code_arr.jitted
 
 
-# ----------------------\
-# Dictionary Operations |
-# ----------------------/
+# ------------------\
+# Superinstructions |
+# ------------------/
 
 
-def is_in_dict(d, name):
+def fuse_square(instructions):
     """
-    Checks if the dictionary d contains the key name.
-    Returns True if the key is found, False otherwise.
+    Builds the superinstruction for "dup mul".
     """
-    return name in d
+    slow = fallback(instructions)
+
+    def square(interpreter):
+        stack = interpreter.op_stack
+        if stack and type(stack[-1]) is int:
+            stack[-1] *= stack[-1]
+        else:
+            slow(interpreter)
+    return square
 
 
-def get_from_dict(d, name):
+def fuse_exch_sub(instructions):
     """
-    Returns the value associated with the key name in dictionary d.
-    Throws an error if key does not exist in d.
+    Builds the superinstruction for "exch sub".
     """
-    if is_in_dict(d, name):
-        return d[name]
-    # May be unnecessary to ever throw this error, but why not just in case.
-    error("get_from_dict", "name not found", [name])
+    slow = fallback(instructions)
 
+    def exch_sub(interpreter):
+        stack = interpreter.op_stack
+        if len(stack) >= 2 and type(stack[-1]) is int and type(stack[-2]) is int:
+            top = stack.pop()
+            stack[-1] = top - stack[-1]
+        else:
+            slow(interpreter)
+    return exch_sub
 
-def add_to_dict(d, name, value):
+
+def fuse_define(instructions):
     """
-    Adds the name-value association pair to dictionary d.
+    Builds the superinstruction for "/name exch def".
     """
-    d[name] = value
+    name = instructions[0][1].symbol
+    slow = fallback(instructions)
+
+    def define(interpreter):
+        stack = interpreter.op_stack
+        if stack:
+            interpreter.define(name, stack.pop())
+        else:
+            slow(interpreter)
+    return define
+
 
+def fuse_constant(operation):
+    """
+    Returns the builder of the superinstruction for an integer literal followed by
+    the integer operator computing operation(operand, literal).
+    """
+    def build(instructions):
+        constant = instructions[0][1]
+        slow = fallback(instructions)
 
-# ----------------------------\
-# Dictionary Stack Operations |
-# ----------------------------/
+        def constant_op(interpreter):
+            stack = interpreter.op_stack
+            if stack and type(stack[-1]) is int:
+                stack[-1] = operation(stack[-1], constant)
+            else:
+                slow(interpreter)
+        return constant_op
+    return build
 
 
-def dict_push(d, link):
+def fuse_branch(operation):
     """
-    Push dictionary d with access link onto the dictionary stack.
+    Returns the builder of the superinstruction for an integer literal followed by
+    the comparison computing operation(operand, literal) and an if or ifelse on literal code arrays.
     """
-    dict_stack.append((d, link))
+    def build(instructions):
+        constant = instructions[0][1]
+        if_code = instructions[2][1]
+        else_code = instructions[3][1] if len(instructions) == 5 else None
+        slow = fallback(instructions)
+
+        def branch(interpreter):
+            stack = interpreter.op_stack
+            if stack and type(stack[-1]) is int:
+                if operation(stack.pop(), constant):
+                    interpreter.execute(if_code)
+                elif else_code is not None:
+                    interpreter.execute(else_code)
+            else:
+                slow(interpreter)
+        return branch
+    return build
+
+
+# Maps the name of every superinstruction to the instructions it fuses, and the builder making its handler
+# from the instructions it replaces. Each instruction is either the handler of an operator,
+# or the type of a literal (int for an integer, Name for a /name, CodeArray for a code array).
+# Every superinstruction hands the instructions it replaces to the interpreter (see fallback)
+# whenever it can't be sure of them, so it fails exactly as they would.
+SUPERINSTRUCTIONS = {
+    "dup mul": ((Interpreter.dup_op, Interpreter.mul_op), fuse_square),
+    "exch sub": ((Interpreter.exch_op, Interpreter.sub_op), fuse_exch_sub),
+    "/name exch def": ((Name, Interpreter.exch_op, Interpreter.def_op), fuse_define),
+    "N add": ((int, Interpreter.add_op), fuse_constant(operator.add)),
+    "N sub": ((int, Interpreter.sub_op), fuse_constant(operator.sub)),
+    "N mul": ((int, Interpreter.mul_op), fuse_constant(operator.mul)),
+    "N eq": ((int, Interpreter.eq_op), fuse_constant(operator.eq)),
+    "N lt": ((int, Interpreter.lt_op), fuse_constant(operator.lt)),
+    "N gt": ((int, Interpreter.gt_op), fuse_constant(operator.gt)),
+    "N eq {} if": ((int, Interpreter.eq_op, CodeArray, Interpreter.if_op), fuse_branch(operator.eq)),
+    "N lt {} if": ((int, Interpreter.lt_op, CodeArray, Interpreter.if_op), fuse_branch(operator.lt)),
+    "N gt {} if": ((int, Interpreter.gt_op, CodeArray, Interpreter.if_op), fuse_branch(operator.gt)),
+    "N eq {} {} ifelse": ((int, Interpreter.eq_op, CodeArray, CodeArray, Interpreter.if_else_op),
+                          fuse_branch(operator.eq)),
+    "N lt {} {} ifelse": ((int, Interpreter.lt_op, CodeArray, CodeArray, Interpreter.if_else_op),
+                          fuse_branch(operator.lt)),
+    "N gt {} {} ifelse": ((int, Interpreter.gt_op, CodeArray, CodeArray, Interpreter.if_else_op),
+                          fuse_branch(operator.gt)),
+}
+
+# The superinstructions fused when there is no profile to choose them from.
+DEFAULT_SUPERINSTRUCTIONS = frozenset(SUPERINSTRUCTIONS)
+
+# The share of a profile's operator calls a superinstruction must cover to be chosen (see choose_superinstructions).
+SUPERINSTRUCTION_SHARE = 0.01
+
+
+def matches(pattern, instructions):
+    """
+    Checks if instructions are exactly the instructions the superinstruction pattern fuses.
+    """
+    if len(instructions) != len(pattern):
+        return False
+    for ((kind, arg), expected) in zip(instructions, pattern):
+        if isinstance(expected, type):
+            if kind != PUSH or type(arg) is not expected:
+                return False
+        elif kind != OP or arg is not expected:
+            return False
+    return True
 
 
-def dict_pop():
+def fuse(instructions, selection):
     """
-    Remove and return top of the dictionary stack.
-    Throws an error if the dictionary stack is empty.
+    Replaces every sequence of instructions matching one of the superinstructions named in selection
+    with a single operator performing the superinstruction, trying the longest ones first.
+    Returns the fused instructions.
     """
-    if is_empty(dict_stack):
-        error("dict_pop", "empty dictionary stack")
-    return dict_stack.pop()
+    patterns = sorted((SUPERINSTRUCTIONS[name] for name in selection if name in SUPERINSTRUCTIONS),
+                      key=lambda entry: len(entry[0]), reverse=True)
+    fused = []
+    i = 0
+    while i < len(instructions):
+        for (pattern, build) in patterns:
+            run = instructions[i:i + len(pattern)]
+            if matches(pattern, run):
+                fused.append((OP, build(run)))
+                i += len(pattern)
+                break
+        else:
+            fused.append(instructions[i])
+            i += 1
+    return fused
 
 
-def def_op():
+def fuse_code(code_arr, selection):
     """
-    Takes a name and a value from the operand stack,
-    gets the top dictionary d from the dictionary stack,
-    adds the name-value association to d,
-    and pushes d back on the dictionary stack.
-    Throws an error if the name is formatted incorrectly.
+    Returns the version of a code array fused with the superinstructions named in selection,
+    fusing it (once per selection) if necessary.
+    The fused version keeps the same source text, so it prints the same.
     """
-    debug("***def_op performed***")
-    debug("Operand Stack (Before): " + str(op_stack)[1:-1])
-    debug("Top Dictionary and Link (Before): " + str(dict_stack[-1])[1:-1])
-    value = op_pop()
-    name = op_pop()
-    if not is_name(name):
-        error("def_op", "trying to define non-name", [name])
-    (d, link) = dict_pop()
-    add_to_dict(d, name[1:], value)
-    dict_push(d, link)
-    debug("Operand Stack (After): " + str(op_stack)[1:-1])
-    debug("Top Dictionary and Link (After): " + str(dict_stack[-1])[1:-1])
-    debug()
+    fused = code_arr.fused
+    if fused is None or (fused[0] is not selection and fused[0] != selection):
+        version = CodeArray(code_arr.source, fuse(code_arr.instructions, selection))
+        version.fused = (selection, version)
+        fused = code_arr.fused = (selection, version)
+    return fused[1]
 
 
-def get_link(name):
+def choose_superinstructions(profile, share=SUPERINSTRUCTION_SHARE):
     """
-    Searches for the name in each dictionary on the dictionary stack,
-    starting with the top dictionary working down.
-    If the name is found in any dictionary, returns the positive index of the
-    dictionary that contains the name.
-    Throws error if the name is not found in any dictionary.
+    Chooses the superinstructions worth fusing for a workload from its profile, as printed by -j
+    (see Profiler.to_json): the ones whose instructions ran at least share of all the operator calls.
+    Returns their names.
     """
-    index = 0
-    dict_stack.reverse()
-    for (d, link) in dict_stack:
-        if is_in_dict(d, name):
-            dict_stack.reverse()
-            return len(dict_stack) - index - 1
-        index += 1
-    error("get_link", "name is undefined", [name])
+    total = sum(entry["calls"] for entry in profile.get("operators", {}).values())
+    counts = profile.get("superinstructions", {})
+    return frozenset(name for (name, count) in counts.items()
+                     if name in SUPERINSTRUCTIONS and count and count >= share * total)
 
 
-def lookup(name):
+def read_profile(filename):
     """
-    If the name is found in or below the current scope, returns the value of the name.
-    Follows static links if static, goes top-down if dynamic.
-    Throws error if the name is not found in or below the current scope.
+    Reads a profile printed by -j from the file filename, and chooses the superinstructions to fuse from it.
+    Returns their names.
+    Throws an error if the file can't be read.
     """
-    if static:
-        index = -1
-        while True:
-            (d, link) = dict_stack[index]
-            debug("Current dictionary: " + str(d))
-            debug("Static link: " + str(link))
-            if is_in_dict(d, name):
-                return get_from_dict(d, name)
+    try:
+        with open(filename) as profile:
+            return choose_superinstructions(json.load(profile))
+    except (IOError, ValueError, AttributeError, KeyError, TypeError):
+        error("reading profile", "file is not a profile", [filename])
+
+
+# ------------\
+# Memoization |
+# ------------/
+
+
+# How many results a memoizing interpreter keeps by default (see Memo).
+MEMO_SIZE = 4096
+
+
+# How many operands each operator a pure procedure may use consumes and produces.
+PURE_EFFECTS = {
+    Interpreter.add_op: (2, 1),
+    Interpreter.sub_op: (2, 1),
+    Interpreter.mul_op: (2, 1),
+    Interpreter.div_op: (2, 1),
+    Interpreter.eq_op: (2, 1),
+    Interpreter.lt_op: (2, 1),
+    Interpreter.gt_op: (2, 1),
+    Interpreter.and_op: (2, 1),
+    Interpreter.or_op: (2, 1),
+    Interpreter.not_op: (1, 1),
+    Interpreter.dup_op: (1, 2),
+    Interpreter.exch_op: (2, 2),
+    Interpreter.op_pop: (1, 0),
+}
+
+# The effect of a sequence that calls the procedure being analyzed before its effect is known.
+UNKNOWN = "unknown"
+
+# How deeply procedure calls and if/ifelse bodies may nest before a procedure is taken not to be pure,
+# keeping the analysis well within Python's recursion limit.
+EFFECT_DEPTH = 100
+
+
+def sequence_effect(instructions, name, assumed, globals, effects, nesting=0):
+    """
+    Works out the effect of running instructions as part of the body of the pure procedure name
+    (see procedure_effect), taking assumed as the effect of calling name itself (None if not known yet),
+    nesting calls and if/ifelse bodies deep.
+    Returns the (consumed, produced, names) effect of instructions, with names the set of names it uses,
+    None if it is not pure (or nested deeper than EFFECT_DEPTH), or UNKNOWN if it calls name before
+    its effect is known.
+    """
+    if nesting > EFFECT_DEPTH:
+        return None
+    depth = 0
+    low = 0
+    names = set()
+    # The code arrays among the operands this sequence pushed (None for any other operand), topmost last.
+    literals = []
+
+    for (kind, arg) in instructions:
+        if kind == PUSH:
+            effect = (0, 1)
+        elif kind == NAME:
+            names.add(arg)
+            if arg == name:
+                if assumed is None:
+                    return UNKNOWN
+                effect = assumed
+            elif arg not in globals:
+                return None
+            elif not is_code(globals[arg]):
+                effect = (0, 1)
             else:
-                if not is_int(link):
-                    error("lookup", "name is undefined in current static scope", [name])
-                if index == link:
-                    error("lookup", "infinite loop", [name])
-                debug("Following static link to index " + str(link) + "...")
-                index = link
+                effect = procedure_effect(arg, globals[arg], globals, effects, nesting + 1)
+                if effect is None:
+                    return None
+                names |= effect[2]
+        elif arg in PURE_EFFECTS:
+            effect = PURE_EFFECTS[arg]
+        elif arg is Interpreter.if_op or arg is Interpreter.if_else_op:
+            # Both ways through must consume and produce the same number of operands.
+            count = 1 if arg is Interpreter.if_op else 2
+            if len(literals) < count or None in literals[-count:]:
+                return None
+            branches = [sequence_effect(code.instructions, name, assumed, globals, effects, nesting + 1)
+                        for code in literals[-count:]]
+            if arg is Interpreter.if_op:
+                branches.append((0, 0, set()))
+            if None in branches:
+                return None
+            known = [branch for branch in branches if branch is not UNKNOWN]
+            if not known:
+                return UNKNOWN
+            if len(set(produced - consumed for (consumed, produced, used) in known)) > 1:
+                return None
+            consumed = max(consumed for (consumed, produced, used) in known)
+            effect = (consumed + count + 1, consumed + known[0][1] - known[0][0])
+            for branch in known:
+                names |= branch[2]
+        else:
+            return None
+        depth -= effect[0]
+        low = min(low, depth)
+        depth += effect[1]
+        del literals[max(0, len(literals) - effect[0]):]
+        literals += [arg if kind == PUSH and is_code(arg) else None] * effect[1]
+
+    return (-low, depth - low, names)
+
+
+def procedure_effect(name, code, globals, effects, nesting=0):
+    """
+    Works out, once, whether the procedure code bound to name in the global dictionary globals is pure:
+    whether all it does is consume operands and produce results from them, using only literals,
+    stack, arithmetic, comparison and boolean operators, if/ifelse on literal code arrays,
+    and names bound to other pure procedures or plain values.
+    Returns its (consumed, produced, names) effect, with names the set of names it depends on,
+    or None if it is not pure (or not always consuming and producing the same number of operands).
+    A recursive procedure's effect is worked out from the ways through it that don't recurse,
+    then checked against the ones that do. Effects are memoized in effects.
+    Called nesting procedures deep (see sequence_effect).
+    """
+    if name in effects:
+        return effects[name]
+    # Any other procedure calling back into this one before it is worked out is not pure.
+    effects[name] = None
+    effect = sequence_effect(code.instructions, name, None, globals, effects, nesting)
+    if effect is not None and effect is not UNKNOWN:
+        checked = sequence_effect(code.instructions, name, effect[:2], globals, effects, nesting)
+        if checked is None or checked is UNKNOWN or checked[:2] != effect[:2]:
+            effect = None
+        else:
+            effect = (effect[0], effect[1], frozenset(checked[2] | {name}))
     else:
-        link = get_link(name)
-        debug("Following dynamic links, the name \"" + str(name) + "\" was found at index " + str(link))
-        if not is_int(link):
-            error("lookup", "name is undefined in current dynamic scope", [name])
-        (d, link) = dict_stack[link]
-        return get_from_dict(d, name)
+        effect = None
+    effects[name] = effect
+    return effect
+
+
+class Memo:
+    """
+    The memoized results of an interpreter's calls to pure procedures (see procedure_effect),
+    keyed by the procedure's name and the operands it consumed (and their types, as True == 1),
+    keeping only the size most recently used ones, along with how many calls hit and missed.
+    Only procedures bound in the global dictionary are memoized. Redefining any name their effects
+    depend on forgets every result.
+    """
+    __slots__ = ("size", "results", "effects", "names", "hits", "misses")
+
+    def __init__(self, size=MEMO_SIZE):
+        self.size = size
+        self.results = OrderedDict()
+        self.effects = {}
+        # Every name the memoized results depend on.
+        self.names = set()
+        self.hits = 0
+        self.misses = 0
+
+    def recall(self, interpreter, name, code):
+        """
+        Looks up the results of calling the global procedure code, bound to name, on interpreter's operands.
+        If they are known, replaces the operands with them and returns True.
+        Otherwise returns a (key, base, produced) record for remember, once the call is done,
+        or None if the call can't be memoized.
+        """
+        effect = self.effects.get(name, False)
+        if effect is False:
+            effect = procedure_effect(name, code, interpreter.dict_stack[0][0], self.effects)
+        if effect is None:
+            return None
+        (consumed, produced, names) = effect
+        stack = interpreter.op_stack
+        if len(stack) < consumed:
+            return None
+        if not interpreter.static:
+            # Under dynamic scoping, a name defined anywhere but the global dictionary might resolve differently.
+            for used in names:
+                if len(interpreter.name_index[used]) > 1:
+                    return None
+        base = len(stack) - consumed
+        operands = tuple(stack[base:])
+        key = (name, operands, tuple(map(type, operands)))
+        results = self.results.get(key)
+        if results is not None:
+            self.results.move_to_end(key)
+            self.hits += 1
+            stack[base:] = results
+            return True
+        self.misses += 1
+        self.names |= names
+        return (key, base, produced)
+
+    def remember(self, interpreter, records):
+        """
+        Memoizes the results of the finished calls in records (see recall),
+        now on top of interpreter's operand stack.
+        """
+        stack = interpreter.op_stack
+        for (key, base, produced) in records:
+            if len(stack) == base + produced:
+                self.results[key] = stack[base:]
+                if len(self.results) > self.size:
+                    self.results.popitem(last=False)
+
+    def forget(self, name):
+        """
+        Forgets everything that depends on name, which was just defined in the global dictionary.
+        """
+        self.effects.clear()
+        if name in self.names:
+            self.results.clear()
+            self.names.clear()
+
+
+# ---------------\
+# Compiled Cache |
+# ---------------/
+
+
+# Compiled programs are cached next to their source as .sspc files: the magic number,
+# the length of the marshalled key, the marshalled key (checked before anything else is loaded),
+# then the marshalled (code arrays, top-level instructions) pair.
+CACHE_MAGIC = b"SSPC"
+# Bump whenever compiled instructions change, so caches written by older versions are never used.
+CACHE_VERSION = 3
+# Code arrays in cached instructions are stored as CACHED_CODE instructions carrying their index,
+# and /names as CACHED_NAME instructions carrying their text.
+CACHED_CODE = 3
+CACHED_NAME = 4
+
+
+def cache_filename(filename):
+    """
+    Returns the filename of the compiled cache for the SSPS program in the file filename.
+    """
+    return os.path.splitext(filename)[0] + ".sspc"
+
+
+def cache_key(filename, static):
+    """
+    Returns the key a compiled cache for the SSPS program in the file filename must have to be used:
+    the cache and Python versions, the scoping mode and a hash of the program's contents.
+    Throws an error if the file can't be read.
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(filename, "rb") as source:
+            for chunk in iter(lambda: source.read(1 << 20), b""):
+                digest.update(chunk)
+    except IOError:
+        error("reading file", "file does not exist", [filename])
+    return (CACHE_VERSION, tuple(sys.version_info[:2]), static, digest.hexdigest())
+
+
+def encode_program(instructions):
+    """
+    Encodes top-level instructions into plain marshallable data.
+    Returns the encoded code arrays, each listed after the code arrays it contains,
+    and the encoded top-level instructions.
+    Operators are encoded by name, code arrays by their index in the encoded code arrays
+    and /names by their text.
+    """
+    names = {handler: name for (name, handler) in operators.items()}
+    arrays = []
+    indices = {}
+
+    def encode(instructions):
+        encoded = []
+        for (kind, arg) in instructions:
+            if kind == OP:
+                encoded.append((OP, names[arg]))
+            elif kind == PUSH and is_code(arg):
+                encoded.append((CACHED_CODE, indices[id(arg)]))
+            elif kind == PUSH and is_name(arg):
+                encoded.append((CACHED_NAME, arg.text))
+            else:
+                encoded.append((kind, arg))
+        return tuple(encoded)
+
+    for (kind, arg) in instructions:
+        if kind != PUSH or not is_code(arg):
+            continue
+        # Encode the code arrays in post-order, without recursing.
+        pending = [(arg, False)]
+        while pending:
+            (code_arr, expanded) = pending.pop()
+            if id(code_arr) in indices:
+                continue
+            if expanded:
+                indices[id(code_arr)] = len(arrays)
+                arrays.append((code_arr.source, encode(code_arr.instructions)))
+                continue
+            pending.append((code_arr, True))
+            for (inner_kind, inner_arg) in code_arr.instructions:
+                if inner_kind == PUSH and is_code(inner_arg) and id(inner_arg) not in indices:
+                    pending.append((inner_arg, False))
+    return (tuple(arrays), encode(instructions))
+
+
+def decode_program(arrays, top):
+    """
+    Decodes the code arrays and top-level instructions encoded by encode_program,
+    sharing any code arrays already in the code cache.
+    Returns the top-level instructions.
+    Throws KeyError if an operator no longer exists.
+    """
+    code_arrs = []
+
+    def decode(encoded):
+        # Lazy, so code arrays already in the code cache are never decoded.
+        for instruction in encoded:
+            kind = instruction[0]
+            if kind == OP:
+                instruction = (OP, operators[instruction[1]])
+            elif kind == CACHED_CODE:
+                instruction = (PUSH, code_arrs[instruction[1]])
+            elif kind == CACHED_NAME:
+                instruction = (PUSH, make_name(instruction[1]))
+            elif kind == NAME:
+                instruction = (NAME, symbol(instruction[1]))
+            yield instruction
+
+    for (source, encoded) in arrays:
+        code_arrs.append(cached_code(source, decode(encoded)))
+    return list(decode(top))
+
+
+def read_cache(filename, key):
+    """
+    Reads the compiled cache for the SSPS program in the file filename.
+    Returns its top-level instructions, or None if there is no usable cache with the given key.
+    """
+    try:
+        with open(cache_filename(filename), "rb") as cache:
+            data = cache.read()
+        if not data.startswith(CACHE_MAGIC):
+            return None
+        start = len(CACHE_MAGIC) + 4
+        (key_length,) = struct.unpack("<I", data[len(CACHE_MAGIC):start])
+        if marshal.loads(data[start:start + key_length]) != key:
+            return None
+        (arrays, top) = marshal.loads(data[start + key_length:])
+        return decode_program(arrays, top)
+    except (IOError, EOFError, ValueError, TypeError, KeyError, IndexError, struct.error):
+        return None
+
+
+def write_cache(filename, key, instructions):
+    """
+    Writes the compiled cache for the SSPS program in the file filename.
+    Failing to write the cache is not an error, the program just gets compiled again next time.
+    """
+    (arrays, top) = encode_program(instructions)
+    path = cache_filename(filename)
+    temp = path + "." + str(os.getpid()) + ".tmp"
+    try:
+        key_data = marshal.dumps(key)
+        with open(temp, "wb") as cache:
+            cache.write(CACHE_MAGIC)
+            cache.write(struct.pack("<I", len(key_data)))
+            cache.write(key_data)
+            marshal.dump((arrays, top), cache)
+        os.replace(temp, path)
+    except (IOError, ValueError):
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def compile_file(filename, static=False):
+    """
+    Compiles the SSPS program in the file filename into its top-level instructions,
+    loading them from the program's compiled cache when the cache is up to date,
+    and writing a new cache otherwise.
+    Throws an error if the file can't be read.
+    """
+    key = cache_key(filename, static)
+    instructions = read_cache(filename, key)
+    if instructions is None:
+        instructions = list(compile_stream(read_tokens(filename)))
+        write_cache(filename, key, instructions)
+    return instructions
+
+
+# -------\
+# Output |
+# -------/
+
+
+# How many characters an OutputSink holds before writing them out.
+OUTPUT_BUFFER_SIZE = 1 << 16
+
+
+class OutputSink:
+    """
+    Where an interpreter's output goes, collected into one big write whenever
+    OUTPUT_BUFFER_SIZE characters pile up, and whenever it is flushed.
+    Writes to the file file, which can be a real file or an io.StringIO for embedding,
+    or to whatever sys.stdout is at the time if file is None.
+    """
+    __slots__ = ("file", "parts", "size")
+
+    def __init__(self, file=None):
+        self.file = file
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        """
+        Adds text to the buffer, writing the buffer out if it is full.
+        """
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= OUTPUT_BUFFER_SIZE:
+            self.drain()
+
+    def drain(self):
+        """
+        Writes out everything in the buffer.
+        """
+        if self.parts:
+            (self.file or sys.stdout).write("".join(self.parts))
+            self.parts = []
+            self.size = 0
+
+    def flush(self):
+        """
+        Writes out everything in the buffer, and flushes the file.
+        """
+        self.drain()
+        (self.file or sys.stdout).flush()
 
 
 # ----------------\
-# Other Functions |
+# Execution Stack |
 # ----------------/
 
 
-def debug(message="", sep=" ", end="\n"):
-    """
-    Debugging output, only prints if debugging is enabled.
-    """
-    if debugging:
-        print(message, sep, end)
+# The dictionary of every procedure call that hasn't defined anything yet. Never written to.
+EMPTY_FRAME = {}
+# The most cleared dictionaries an interpreter keeps around for reuse.
+FRAME_POOL_SIZE = 256
+
+
+class Continuation:
+    """
+    A code array being interpreted, along with the index of its next instruction
+    and whether it owns the top dictionary (and must pop it when done).
+    A procedure call being profiled also carries its Profiler call record,
+    one being memoized the Memo records of the calls it finishes,
+    and the body of a repeat, for or loop its Loop.
+    """
+    __slots__ = ("code", "pc", "frame", "profile", "memo", "loop")
+
+    def __init__(self, code, frame):
+        self.code = code
+        self.pc = 0
+        self.frame = frame
+        self.profile = None
+        self.memo = None
+        self.loop = None
+
+
+# The code array exit_op leaves behind in place of the loop it stops.
+EMPTY_CODE = CodeArray("", [])
+
+
+class Loop:
+    """
+    What is left of a repeat, for or loop whose body is being interpreted:
+    how many more times to interpret it (None for no end), or for a for loop,
+    the current value, the increment and the limit.
+    """
+    __slots__ = ("remaining", "value", "increment", "limit")
+
+    def __init__(self, remaining, value=None, increment=None, limit=None):
+        self.remaining = remaining
+        self.value = value
+        self.increment = increment
+        self.limit = limit
+
+    def again(self, interpreter):
+        """
+        Returns whether the body should be interpreted again, once it is done,
+        pushing the next value onto interpreter's operand stack first for a for loop.
+        """
+        if self.value is not None:
+            value = self.value + self.increment
+            if (value > self.limit) if self.increment >= 0 else (value < self.limit):
+                return False
+            self.value = value
+            interpreter.op_stack.append(value)
+            return True
+        if self.remaining is None:
+            return True
+        if not self.remaining:
+            return False
+        self.remaining -= 1
+        return True
+
+
+# ----------\
+# Profiling |
+# ----------/
+
+
+# How often a sampling profiler (-q) times an operator or procedure call: every PROFILE_INTERVAL-th one.
+PROFILE_INTERVAL = 16
+
+
+class Profiler:
+    """
+    Records how many times each operator and procedure runs and how long it takes,
+    along with the deepest the operand and dictionary stacks get.
+    An interpreter with a profiler runs its code through the profiler's own copy of the
+    interpreter loop, so interpreters without one pay nothing for it.
+    Sampling with an interval above 1, every operator and procedure call is still counted,
+    but only every interval-th one reads the clock: an operator's time is estimated from the ones timed,
+    and the time since the last reading is charged to the procedures running at the time
+    (to the innermost one's self time), which takes most of the profiler's overhead away.
+    """
+    __slots__ = ("operators", "procedures", "active", "calls", "max_op_depth", "max_dict_depth", "runs",
+                 "interval", "countdown", "last", "entered")
+
+    def __init__(self, interval=1):
+        self.interval = interval
+        # How many more operator and procedure calls go untimed before the next timed one.
+        self.countdown = 0
+        # When the clock was last read, if sampling.
+        self.last = time.perf_counter()
+        # Maps each operator handler to its [calls, time].
+        self.operators = {}
+        # Maps each code array to how many times it started running (see sequences).
+        self.runs = {}
+        # Maps each procedure name to its [calls, cumulative time, self time].
+        self.procedures = {}
+        # Maps each procedure name to its number of unfinished calls, so recursion is timed once.
+        self.active = {}
+        # Maps each procedure name to when it last went from no unfinished calls to one, unless sampling.
+        self.entered = {}
+        # The unfinished call records, [name, start time, time in callees, caller record], innermost last.
+        # If sampling, calls aren't timed, and only the name matters.
+        self.calls = []
+        self.max_op_depth = 0
+        self.max_dict_depth = 1
+
+    def step(self, interpreter, kind, arg):
+        """
+        Interprets the instruction (kind, arg) for interpreter, counting it if it is an operator
+        or calls a procedure (starting a call record), and timing it if it is due to be sampled.
+        """
+        if kind == PUSH:
+            interpreter.op_stack.append(arg)
+        elif kind == OP:
+            entry = self.operators.get(arg)
+            if entry is None:
+                entry = self.operators[arg] = [0, 0.0]
+            entry[0] += 1
+            if self.countdown:
+                self.countdown -= 1
+                arg(interpreter)
+            else:
+                self.countdown = self.interval - 1
+                start = time.perf_counter()
+                if self.interval > 1:
+                    self.charge(start)
+                arg(interpreter)
+                entry[1] += (time.perf_counter() - start) * self.interval
+        else:
+            exec_stack = interpreter.exec_stack
+            top = exec_stack[-1] if exec_stack else None
+            interpreter.call_name(arg)
+            if exec_stack and exec_stack[-1] is not top:
+                entry = self.procedures.get(arg)
+                if entry is None:
+                    entry = self.procedures[arg] = [0, 0.0, 0.0]
+                entry[0] += 1
+                if self.interval > 1:
+                    if self.countdown:
+                        self.countdown -= 1
+                    else:
+                        self.countdown = self.interval - 1
+                        self.charge(time.perf_counter())
+                self.start_call(exec_stack[-1], arg)
+                if len(interpreter.dict_stack) > self.max_dict_depth:
+                    self.max_dict_depth = len(interpreter.dict_stack)
+        if len(interpreter.op_stack) > self.max_op_depth:
+            self.max_op_depth = len(interpreter.op_stack)
+
+    def start_call(self, cont, name):
+        """
+        Starts a call record for a call to the procedure name, running as the continuation cont,
+        timing it unless sampling.
+        """
+        start = time.perf_counter() if self.interval == 1 else 0.0
+        record = [name, start, 0.0, self.calls[-1] if self.calls else None]
+        self.calls.append(record)
+        cont.profile = record
+        if not self.active.get(name):
+            self.active[name] = 0
+            self.entered[name] = start
+        self.active[name] += 1
+
+    def tail_call(self, record, callee):
+        """
+        Finishes the call record of a procedure that made a tail call as the callee's record started
+        (if there is one), handing the callee its caller, since the callee returns straight to it.
+        """
+        if callee is None:
+            self.finish_call(record)
+        else:
+            callee[3] = record[3]
+            self.finish_call(record, callee[1])
+
+    def finish_call(self, record, now=None):
+        """
+        Finishes the call record (now, if given, or else right away), adding its times to its procedure's
+        totals and its cumulative time to its caller's time in callees, unless sampling.
+        A procedure's cumulative time runs from when it has an unfinished call to when it has none,
+        so a chain of tail calls to it counts as one call.
+        """
+        # Calls finish innermost first, except a caller making a tail call, which finishes first.
+        i = len(self.calls) - 1
+        while self.calls[i] is not record:
+            i -= 1
+        del self.calls[i]
+        (name, start, callees, caller) = record
+        self.active[name] -= 1
+        if self.interval > 1:
+            return
+        if now is None:
+            now = time.perf_counter()
+        elapsed = now - start
+        entry = self.procedures[name]
+        entry[2] += max(0.0, elapsed - callees)
+        if not self.active[name]:
+            entry[1] += now - self.entered[name]
+        if caller is not None:
+            caller[2] += elapsed
+
+    def charge(self, now):
+        """
+        Reads the clock for a sampling profiler, charging the time since it was last read (now, as read)
+        to the cumulative time of every procedure running, once each, and to the innermost one's self time.
+        """
+        elapsed = now - self.last
+        self.last = now
+        if self.calls:
+            self.procedures[self.calls[-1][0]][2] += elapsed
+            for (name, count) in self.active.items():
+                if count:
+                    self.procedures[name][1] += elapsed
+
+    def run_stream(self, interpreter, instructions, base):
+        """
+        Interprets the top-level instructions for interpreter, like Interpreter.run_stream.
+        """
+        self.last = time.perf_counter()
+        for (kind, arg) in instructions:
+            self.step(interpreter, kind, arg)
+            self.run_until(interpreter, base)
+
+    def run_until(self, interpreter, base):
+        """
+        Interprets the code arrays on interpreter's execution stack until it is back down to base,
+        like Interpreter.run_until.
+        """
+        exec_stack = interpreter.exec_stack
+        op_stack = interpreter.op_stack
+        while len(exec_stack) > base:
+            cont = exec_stack[-1]
+            instructions = cont.code.instructions
+            pc = cont.pc
+            end = len(instructions)
+            if pc == 0:
+                self.runs[cont.code] = self.runs.get(cont.code, 0) + 1
+            while pc < end:
+                (kind, arg) = instructions[pc]
+                pc += 1
+                if kind == PUSH:
+                    # Pushes are the most common instruction, and take no time worth recording.
+                    op_stack.append(arg)
+                    if len(op_stack) > self.max_op_depth:
+                        self.max_op_depth = len(op_stack)
+                    continue
+                self.step(interpreter, kind, arg)
+                if exec_stack[-1] is not cont:
+                    break
+            cont.pc = pc
+            if exec_stack[-1] is cont:
+                if cont.loop is not None and cont.loop.again(interpreter):
+                    cont.pc = 0
+                    continue
+                exec_stack.pop()
+                if cont.frame:
+                    interpreter.frame_pop()
+                if cont.profile is not None:
+                    self.finish_call(cont.profile)
+                if cont.memo is not None:
+                    interpreter.memo.remember(interpreter, cont.memo)
+            elif pc == end:
+                interpreter.eliminate_tail_call(base)
+
+    def sequences(self):
+        """
+        Returns how many times the instructions of each superinstruction ran, so the superinstructions
+        to fuse can be chosen from the profile: every place a code array has them, times the number of
+        times the code array ran (counting runs cut short by exit or an error as whole ones).
+        """
+        counts = {}
+        for (code, runs) in self.runs.items():
+            instructions = code.instructions
+            for i in range(len(instructions)):
+                for (name, (pattern, build)) in SUPERINSTRUCTIONS.items():
+                    if matches(pattern, instructions[i:i + len(pattern)]):
+                        counts[name] = counts.get(name, 0) + runs
+        return counts
+
+    def rows(self):
+        """
+        Returns a (kind, name, calls, cumulative time, self time) row for every operator and procedure
+        that ran, slowest cumulative time first.
+        """
+        rows = [("operator", handler.__name__, calls, elapsed, elapsed)
+                for (handler, (calls, elapsed)) in self.operators.items()]
+        rows += [("procedure", name, calls, cumulative, own)
+                 for (name, (calls, cumulative, own)) in self.procedures.items()]
+        rows.sort(key=lambda row: row[3], reverse=True)
+        return rows
+
+    def table(self):
+        """
+        Returns the profile as a printable table.
+        """
+        lines = ["%-10s %-24s %10s %14s %14s" % ("Kind", "Name", "Calls", "Cumulative (s)", "Self (s)")]
+        for (kind, name, calls, cumulative, own) in self.rows():
+            lines.append("%-10s %-24s %10d %14.6f %14.6f" % (kind, name, calls, cumulative, own))
+        lines.append("Max operand stack depth: " + str(self.max_op_depth))
+        lines.append("Max dictionary stack depth: " + str(self.max_dict_depth))
+        for (name, count) in sorted(self.sequences().items(), key=lambda item: item[1], reverse=True):
+            lines.append("Superinstruction \"" + name + "\": " + str(count))
+        return "\n".join(lines)
+
+    def to_json(self):
+        """
+        Returns the profile as a JSON string.
+        """
+        return json.dumps({
+            "operators": {name: {"calls": calls, "cumulative": cumulative, "self": own}
+                          for (kind, name, calls, cumulative, own) in self.rows() if kind == "operator"},
+            "procedures": {name: {"calls": calls, "cumulative": cumulative, "self": own}
+                           for (kind, name, calls, cumulative, own) in self.rows() if kind == "procedure"},
+            "max_op_stack_depth": self.max_op_depth,
+            "max_dict_stack_depth": self.max_dict_depth,
+            "superinstructions": self.sequences(),
+        }, indent=2)
+
+
+# ----------------\
+# Other Functions |
+# ----------------/
 
 
 def is_bool(value):
@@ -531,6 +2737,14 @@ def is_string(value):
     return type(value) is str
 
 
+def is_code(value):
+    """
+    Helper function that checks if value is a compiled code array.
+    Returns True if value is a code array, False if not.
+    """
+    return type(value) is CodeArray
+
+
 def is_dict(value):
     """
     Helper function that checks if value is a dictionary.
@@ -544,11 +2758,7 @@ def is_name(value):
     Helper function that checks if value is a /name.
     Returns True if value is a /name, False if not.
     """
-    if not is_string(value):
-        return False
-    if value[0] != '/':
-        return False
-    return True
+    return type(value) is Name
 
 
 def is_empty(stack):
@@ -559,150 +2769,207 @@ def is_empty(stack):
     return len(stack) < 1
 
 
-def error(criminal, crime, accomplices=[]):
+# ---------\
+# Sessions |
+# ---------/
+
+
+class Session:
     """
-    Prints semi-detailed error message and exits program.
+    Feeds SSPS to a long-lived interpreter a line at a time, running each fragment as soon as every
+    code array in it is closed, so its stacks (and every definition so far) carry over between fragments.
+    Compiled code arrays are shared through the code cache for as long as they stay in it (see cached_code).
     """
-    print("Error in ", criminal, ": ", crime, ".", sep="")
-    if accomplices != []:
-        print("Problem Arguments: ", str(accomplices)[1:-1])
-    op_stack.reverse()
-    dict_stack.reverse()
-    print("SPS Operand Stack: ", str(op_stack)[1:-1])
-    print("SPS Dictionary Stack: ", str(dict_stack)[1:-1])
-    dict_stack.reverse()
-    op_stack.reverse()
-    print("Exiting program.")
-    sys.exit()
+    __slots__ = ("interpreter", "pending", "depth")
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        # The tokens of the fragment read so far, and how many code arrays in it are still open.
+        self.pending = []
+        self.depth = 0
+
+    def feed(self, line):
+        """
+        Adds the tokens of line to the pending fragment, and runs the fragment if it is complete.
+        Returns True if the fragment is still waiting for a code array to be closed, False if not.
+        Raises an SSPSError if the fragment fails, leaving the stacks as they were when it happened.
+        """
+        for token in tokenize(line):
+            if token == '{':
+                self.depth += 1
+            elif token == '}' and self.depth > 0:
+                self.depth -= 1
+            self.pending.append(token)
+        if self.depth > 0:
+            return True
+        (tokens, self.pending) = (self.pending, [])
+        self.interpreter.run_stream(compile_stream(tokens))
+        return False
 
 
-def condense(code):
+def run_session(interpreter, lines, prompting=False):
+    """
+    Runs every line read from the file lines through a Session on interpreter.
+    A failing fragment is reported the same way the command line does,
+    and the session goes on in the dictionaries the fragment started in.
+    If prompting, prints a prompt before each line (a different one while a code array is open).
+    """
+    session = Session(interpreter)
+    waiting = False
+    while True:
+        if prompting:
+            print("... " if waiting else "ssps> ", end="", flush=True)
+        line = lines.readline()
+        if not line:
+            break
+        try:
+            waiting = session.feed(line)
+        except SSPSError as err:
+            interpreter.report(err)
+            interpreter.unwind()
+            waiting = False
+
+
+def serve_session(interpreter, path):
+    """
+    Listens on a Unix domain socket at path, running every line sent over each connection
+    through run_session on interpreter, and sending back everything it prints.
+    Connections are served one at a time, all sharing the interpreter's stacks, until interrupted.
+    A socket left over at path is replaced.
+    Throws an error if anything other than a socket is at path.
+    """
+    if os.path.lexists(path):
+        if not is_socket(path):
+            error("serving session", "file is not a socket", [path])
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(path)
+        server.listen()
+        while True:
+            (connection, address) = server.accept()
+            with connection, connection.makefile("r") as reader, connection.makefile("w") as writer:
+                with contextlib.redirect_stdout(writer):
+                    run_session(interpreter, reader)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if is_socket(path):
+            os.remove(path)
+
+
+def is_socket(path):
     """
-    Tokenize code string and, additionally, condense outermost code arrays
-    from code into singular token strings with curly braces included.
+    Checks if path is a Unix domain socket (without following symbolic links).
+    Returns True if it is, False if not (or if there is nothing at path).
     """
-    tokens = re.findall("/?[a-zA-Z][a-zA-Z0-9_]*|[-]?[0-9]+|[}{]+|%.*|[^ \t\n]", code)
-    if '{' not in code:
-        return tokens
-    count = 0
-    code_arr = ""
-    res = []
-    for token in tokens:
-        if count != 0:
-            if token == '{':
-                count += 1
-            if token == '}':
-                count -= 1
-            if count == 0:
-                res.append('{' + code_arr[:-1] + '}')
-                code_arr = ""
-            else:
-                code_arr += token + " "
-        else:
-            if token == '{':
-                count += 1
-            else:
-                res.append(token)
-    return res
+    try:
+        return stat.S_ISSOCK(os.lstat(path).st_mode)
+    except OSError:
+        return False
+
+
+# -----------------\
+# Running Programs |
+# -----------------/
 
 
-def interpret(code):
+def read_manifest(filename):
     """
-    Takes a string of an SPS program as an argument, tokenizes it,
-    and for each token, performs the appropriate SPS action accordingly.
+    Reads a batch manifest, a file listing one SSPS program filename per line.
+    Returns the list of filenames, skipping blank lines.
+    Throws an error if the file can't be read.
     """
-    debug("=======================Interpreting Code=======================")
-    debug("Code: \"" + code + "\"")
-    debug("Operand stack: " + str(op_stack)[1:-1])
-    debug("Dictionary stack: " + str(dict_stack)[1:-1])
-    debug("Top dictionary: " + str(dict_stack[-1])[1:-1])
-    debug()
+    try:
+        with open(filename) as manifest:
+            return [line.strip() for line in manifest if line.strip()]
+    except IOError:
+        error("reading manifest", "file does not exist", [filename])
 
-    # Tokenize and condense the code.
-    tokens = condense(code)
-    for token in tokens:
-        # Handling operations....
-        if token == "add":
-            add_op()
-        elif token == "sub":
-            sub_op()
-        elif token == "mul":
-            mul_op()
-        elif token == "div":
-            div_op()
-        elif token == "eq":
-            eq_op()
-        elif token == "lt":
-            lt_op()
-        elif token == "gt":
-            gt_op()
-        elif token == "and":
-            and_op()
-        elif token == "or":
-            or_op()
-        elif token == "not":
-            not_op()
-        elif token == "if":
-            if_op()
-        elif token == "ifelse":
-            if_else_op()
-        elif token == "dup":
-            dup_op()
-        elif token == "exch":
-            exch_op()
-        elif token == "stack":
-            stack_op()
-        elif token == "=":
-            top_op()
-        elif token == "pop":
-            op_pop()
-        elif token == "def":
-            def_op()
-        # ...handling pushing bools and code arrays.
-        elif token == "true":
-            op_push(True)
-        elif token == "false":
-            op_push(False)
-        elif token[0] == '{':
-            op_push(token[1:-1])
-        else:
-            # Could now be an integer, /name or name lookup; if int, push the int.
-            try:
-                num = int(token)
-                op_push(num)
-            except ValueError:
-                # Could now be a /name or a name lookup; if /name, push the /name.
-                if is_name(token):
-                    op_push(token)
-                else:
-                    debug("***Name lookup***")
-                    debug("Name being looked up: \"" + token + "\"")
-                    debug("Dictionary stack: " + str(dict_stack)[1:-1])
 
-                    # lookup name and receive code.
-                    code = lookup(token)
+def load_file(interpreter, filename, cached=False):
+    """
+    Runs the SSPS program in the file filename on interpreter,
+    leaving its results on the interpreter's stacks.
+    If cached, the program is compiled through its compiled cache (see compile_file).
+    Raises an SSPSError if the program fails.
+    """
+    if cached:
+        instructions = compile_file(filename, interpreter.static)
+    else:
+        instructions = compile_stream(read_tokens(filename))
+    interpreter.run_stream(instructions)
+
 
-                    debug("Code found: \"" + str(code) + "\"")
-                    debug()
+def report_profile(interpreter, profiling):
+    """
+    Prints interpreter's profile to stderr in the format profiling ("table" or "json"),
+    along with how many calls its memo hit and missed, if it has a memo. Prints nothing if profiling is None.
+    """
+    if not profiling:
+        return
+    if profiling == "json":
+        print(interpreter.profiler.to_json(), file=sys.stderr)
+    else:
+        print(interpreter.profiler.table(), file=sys.stderr)
+    if interpreter.memo is not None:
+        print("Memo hits: " + str(interpreter.memo.hits) + ", misses: " + str(interpreter.memo.misses), file=sys.stderr)
+
+
+def run_file(filename, static=False, debugging=False, cached=False, optimizing=False, profiling=None,
+             tiered=False, memo_size=0, superinstructions=None, profile_interval=1):
+    """
+    Runs the SSPS program in the file filename in a fresh interpreter,
+    reporting any error the same way the command line does.
+    If cached, the program is compiled through its compiled cache (see compile_file).
+    If profiling is "table" or "json", the program's profile is printed to stderr in that format afterwards,
+    timing only every profile_interval-th operator and procedure call (see Profiler).
+    If tiered, code arrays that run often are transpiled into Python functions.
+    If memo_size isn't 0, up to memo_size results of pure procedures are memoized.
+    If superinstructions isn't None, code arrays are fused with the superinstructions it names.
+    Returns True if the program failed, False if not.
+    """
+    interpreter = Interpreter(static, debugging, optimizing, profile_interval if profiling else False, tiered=tiered,
+                              memo_size=memo_size, superinstructions=superinstructions)
+    failed = False
+    try:
+        load_file(interpreter, filename, cached)
+    except SSPSError as err:
+        interpreter.report(err)
+        print("Exiting program.")
+        failed = True
+    report_profile(interpreter, profiling)
+    return failed
 
-                    # Create dummy link if dynamic.
-                    # Using scientific number of the beast for the lols.
-                    link = 666
-                    if static:
-                        debug("***Getting Link***")
-                        debug("Name being looked up: \"" + token + "\"")
-                        debug("Dictionary stack: " + str(dict_stack)[1:-1])
 
-                        # Get link before interpreting if static.
-                        link = get_link(token)
+def run_captured(filename, static=False, debugging=False, cached=False, optimizing=False, profiling=None,
+                 tiered=False, memo_size=0, superinstructions=None, profile_interval=1):
+    """
+    Runs the SSPS program in the file filename like run_file, capturing everything it prints.
+    Returns the filename, the captured output, and whether the program failed.
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        failed = run_file(filename, static, debugging, cached, optimizing, profiling, tiered, memo_size,
+                          superinstructions, profile_interval)
+    return (filename, output.getvalue(), failed)
 
-                        debug("Link made: index " + str(link))
-                        debug()
 
-                    # Recursively interpret the string version of the code received.
-                    dict_push({}, link)
-                    interpret(str(code))
-                    dict_pop()
+def run_batch(filenames, static=False, debugging=False, cached=False, optimizing=False, profiling=None,
+              tiered=False, memo_size=0, superinstructions=None, profile_interval=1, workers=None):
+    """
+    Runs every SSPS program in filenames, each in its own interpreter,
+    across a pool of worker processes (one per core by default).
+    The workers are reused between programs, keeping their code caches warm.
+    Yields the results of run_captured in the same order as filenames.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(filenames) // (workers * 4))
+    with ProcessPoolExecutor(workers) as executor:
+        yield from executor.map(run_captured, filenames, repeat(static), repeat(debugging), repeat(cached),
+                                repeat(optimizing), repeat(profiling), repeat(tiered), repeat(memo_size),
+                                repeat(superinstructions), repeat(profile_interval), chunksize=chunksize)
 
 
 # ----------------\
@@ -712,30 +2979,33 @@ def interpret(code):
 
 if __name__ == "__main__":
 
-    import sys
-    import re
-
-    # Our operand and dictionary stacks, as well as static and debugging flags.
-    global op_stack
-    global dict_stack
-    global static
-    global debugging
-    op_stack = []
-    dict_stack = [({}, None)]
+    # Our static, debugging, batch, session, serving, cached, optimizing, profiling and tiered flags, memo size,
+    # superinstructions and profile interval.
     static = False
     debugging = False
-
-    # Gather command line arguments and filename in clean format.
+    batch = False
+    session = False
+    serving = False
+    cached = False
+    optimizing = False
+    profiling = None
+    tiered = False
+    memo_size = 0
+    superinstructions = None
+    profile_interval = 1
+
+    # Gather command line arguments and filenames in clean format.
     args = ""
-    filename = ""
-    for arg in sys.argv:
+    filenames = []
+    for arg in sys.argv[1:]:
         if arg[0] == '-':
             for c in arg[1:]:
                 args += c
         else:
-            filename = arg
+            filenames.append(arg)
 
-    # Set static and debugging flags based on command line arguments.
+    # Set static, debugging, batch, session, serving, cached, optimizing, profiling and tiered flags, memo size,
+    # superinstructions and profile interval, based on command line arguments.
     for c in args:
         if c == 's':
             static = True
@@ -743,18 +3013,81 @@ if __name__ == "__main__":
             static = False
         elif c == 'x':
             debugging = True
+        elif c == 'b':
+            batch = True
+        elif c == 'i':
+            session = True
+        elif c == 'u':
+            serving = True
+        elif c == 'c':
+            cached = True
+        elif c == 'O':
+            optimizing = True
+        elif c == 'p':
+            profiling = profiling or "table"
+        elif c == 'j':
+            profiling = "json"
+        elif c == 'q':
+            profiling = profiling or "table"
+            profile_interval = PROFILE_INTERVAL
+        elif c == 't':
+            tiered = True
+        elif c == 'm':
+            memo_size = MEMO_SIZE
+        elif c == 'f':
+            superinstructions = DEFAULT_SUPERINSTRUCTIONS
         else:
             print("Command line argument '", c, "' not recognized. Skipping...", sep="")
 
-    # Open file passed in via command line, store file's lines as one code string.
-    lines = []
-    try:
-        lines = open(filename).readlines()
-    except IOError:
-        error("reading file", "file does not exist", [filename])
-    program = ""
-    for line in lines:
-        program += line[:-1] + " "
-
-    # Finally, interpret the program code, and cross your fingers...
-    interpret(program)
\ No newline at end of file
+    # Choose the superinstructions from any profile passed in via command line instead.
+    if superinstructions is not None:
+        profiles = [filename for filename in filenames if filename.endswith(".json")]
+        filenames = [filename for filename in filenames if not filename.endswith(".json")]
+        if profiles:
+            try:
+                superinstructions = frozenset().union(*map(read_profile, profiles))
+            except SSPSError as err:
+                print(err)
+                sys.exit()
+
+    if session or serving:
+        # Run every setup file passed in via command line, then keep the interpreter around for a session.
+        interpreter = Interpreter(static, debugging, optimizing, profile_interval if profiling else False,
+                                  tiered=tiered, memo_size=memo_size, superinstructions=superinstructions)
+        # The socket is served at the last filename argument, unless it is an SSPS program.
+        socket_path = "ssps.sock"
+        if serving and filenames and not filenames[-1].endswith(".ssps"):
+            socket_path = filenames.pop()
+        for filename in filenames:
+            try:
+                load_file(interpreter, filename, cached)
+            except SSPSError as err:
+                interpreter.report(err)
+        if serving:
+            try:
+                serve_session(interpreter, socket_path)
+            except SSPSError as err:
+                print(err)
+        else:
+            run_session(interpreter, sys.stdin, sys.stdin.isatty())
+        report_profile(interpreter, profiling)
+    elif not batch:
+        # Interpret the last file passed in via command line, and cross your fingers...
+        run_file(filenames[-1] if filenames else "", static, debugging, cached, optimizing, profiling, tiered,
+                 memo_size, superinstructions, profile_interval)
+    else:
+        # Run every file passed in via command line, or listed in an @manifest, printing each one's output in order.
+        programs = []
+        for filename in filenames:
+            if filename[0] == '@':
+                try:
+                    programs += read_manifest(filename[1:])
+                except SSPSError as err:
+                    print(err)
+                    sys.exit()
+            else:
+                programs.append(filename)
+        for (filename, output, failed) in run_batch(programs, static, debugging, cached, optimizing, profiling,
+                                                    tiered, memo_size, superinstructions, profile_interval):
+            print("====", filename, "====")
+            print(output, end="")
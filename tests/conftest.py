@@ -0,0 +1,23 @@
+# Shared fixtures for the tests, which import the ssps.py in the directory above this one.
+
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import ssps
+
+
+@pytest.fixture
+def make_interpreter():
+    """
+    Returns a function making an Interpreter that prints into memory, taking the same arguments
+    as Interpreter (but output), and returning the interpreter along with the io.StringIO it prints to.
+    """
+    def make(*args, **kwargs):
+        output = io.StringIO()
+        return (ssps.Interpreter(*args, output=ssps.OutputSink(output), **kwargs), output)
+    return make
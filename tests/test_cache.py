@@ -0,0 +1,24 @@
+# Tests for the compiled cache (-c).
+
+import ssps
+
+
+def test_cache_from_older_version_is_ignored(tmp_path, make_interpreter):
+    program = tmp_path / "loop.ssps"
+    program.write_text("0 3 { 1 add } repeat =\n")
+    filename = str(program)
+    # Before repeat was an operator, version 2 caches compiled it as a name lookup.
+    key = ssps.cache_key(filename, False)
+    stale = [(ssps.PUSH, 0), (ssps.PUSH, 3), (ssps.PUSH, ssps.compile_code("1 add")),
+             (ssps.NAME, ssps.symbol("repeat")), (ssps.OP, ssps.Interpreter.top_op)]
+    ssps.write_cache(filename, (ssps.CACHE_VERSION - 1,) + key[1:], stale)
+    (interpreter, output) = make_interpreter()
+    ssps.load_file(interpreter, filename, True)
+    assert output.getvalue() == "3\n"
+
+
+def test_code_cache_is_bounded(make_interpreter):
+    source = "".join("true { %d pop } if\n" % i for i in range(ssps.CODE_CACHE_SIZE + 100))
+    (interpreter, output) = make_interpreter()
+    interpreter.run(source)
+    assert len(ssps.code_cache) <= ssps.CODE_CACHE_SIZE
@@ -0,0 +1,15 @@
+# Tests for embedding an Interpreter in a Python program.
+
+import pytest
+
+import ssps
+
+
+def test_run_after_a_failed_run_starts_in_the_global_dictionary(make_interpreter):
+    (interpreter, output) = make_interpreter()
+    with pytest.raises(ssps.UndefinedNameError):
+        interpreter.run("/f { /y 1 def nothing } def f")
+    assert len(interpreter.dict_stack) == 2
+    interpreter.run("/z 2 def")
+    assert len(interpreter.dict_stack) == 1
+    assert interpreter.dict_stack[0][0]["z"] == 2
@@ -0,0 +1,72 @@
+# Checks that every flag that only changes how fast programs run (-O, -c, -t, -m, -f) leaves their output
+# (and their errors) exactly the same as a plain run, over every benchmark workload and a set of failing programs.
+
+import glob
+import os
+import shutil
+
+import pytest
+
+import ssps
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKLOADS = sorted(glob.glob(os.path.join(HERE, "..", "benchmarks", "*.ssps")))
+
+# Programs failing partway through, in the middle of code the flags change.
+FAILING = {
+    "square": "/sq { dup mul } def 3 sq = 1 1 60 { sq pop } for true sq",
+    "constant": "/dec { 1 sub } def 5 dec = 1 1 60 { dec pop } for true dec",
+    "branch": "/f { 0 eq { 1 } { 2 } ifelse } def 0 f = 1 1 60 { f pop } for true f",
+    "define": "/g { /x exch def x } def 4 g = g",
+    "exch_sub": "/h { exch sub } def 1 3 h = 1 h",
+    "divide": "/d { div } def 1 1 60 { 10 exch d pop } for 1 0 d",
+    "memo": "/fib { dup 2 lt { } { dup 1 sub fib exch 2 sub fib add } ifelse } def 20 fib = true fib",
+    "exit": "0 { 1 add dup 5 eq { exit } if } loop = exit",
+    "undefined": "/k { 1 add nothing } def 0 1 1 60 { pop 1 add } for = 1 k",
+    "tail_frames": "/caller { /x 1 def /g { x = } def /callee { /x 2 def g } def callee } def caller",
+    "static_link": "/x 1 def /f { x = } def /g { /x 2 def /f { x = 99 = } def h } def /h { f } def g",
+}
+
+# Keyword arguments to run_captured for each combination of flags.
+FLAGS = {
+    "-O": {"optimizing": True},
+    "-c": {"cached": True},
+    "-t": {"tiered": True},
+    "-m": {"memo_size": ssps.MEMO_SIZE},
+    "-f": {"superinstructions": ssps.DEFAULT_SUPERINSTRUCTIONS},
+    "-Otmf": {"optimizing": True, "tiered": True, "memo_size": ssps.MEMO_SIZE,
+              "superinstructions": ssps.DEFAULT_SUPERINSTRUCTIONS},
+    "-Omfc": {"optimizing": True, "memo_size": ssps.MEMO_SIZE, "superinstructions": ssps.DEFAULT_SUPERINSTRUCTIONS,
+              "cached": True},
+}
+
+
+def programs(tmp_path):
+    """
+    Copies every workload into tmp_path and writes every failing program there, so -c caches land there too.
+    Returns their filenames.
+    """
+    filenames = []
+    for workload in WORKLOADS:
+        filenames.append(shutil.copy(workload, tmp_path))
+    for (name, source) in FAILING.items():
+        path = tmp_path / (name + ".ssps")
+        path.write_text(source + "\n")
+        filenames.append(str(path))
+    return filenames
+
+
+# The output of a plain run of each program (by its base name) in each scoping mode.
+plain = {}
+
+
+@pytest.mark.parametrize("flags", sorted(FLAGS))
+@pytest.mark.parametrize("static", [False, True], ids=["dynamic", "static"])
+def test_same_output_as_plain_run(tmp_path, flags, static):
+    for filename in programs(tmp_path):
+        key = (os.path.basename(filename), static)
+        if key not in plain:
+            plain[key] = ssps.run_captured(filename, static)[1:]
+        # With -c, twice, so the second run comes from the cache the first one wrote.
+        for attempt in range(2 if "c" in flags else 1):
+            assert ssps.run_captured(filename, static, **FLAGS[flags])[1:] == plain[key], (filename, attempt)
@@ -0,0 +1,30 @@
+# Tests for memoizing pure procedures (-m).
+
+import ssps
+
+
+def test_pure_procedure_hits(make_interpreter):
+    (interpreter, output) = make_interpreter(memo_size=ssps.MEMO_SIZE)
+    interpreter.run("/fib { dup 2 lt { } { dup 1 sub fib exch 2 sub fib add } ifelse } def 25 fib =")
+    assert output.getvalue() == "75025\n"
+    assert interpreter.memo.hits > 0
+
+
+def test_tail_calls_remember_only_the_outermost_call(make_interpreter):
+    (interpreter, output) = make_interpreter(memo_size=ssps.MEMO_SIZE)
+    interpreter.run("/count { dup 0 gt { 1 sub count } if } def 50000 count =")
+    assert output.getvalue() == "0\n"
+    assert len(interpreter.memo.results) == 1
+
+
+def test_long_procedure_chains_are_not_memoized(make_interpreter):
+    (interpreter, output) = make_interpreter(memo_size=ssps.MEMO_SIZE)
+    chain = " ".join("/p%d { p%d } def" % (i, i - 1) for i in range(1, 600))
+    interpreter.run("/p0 { 1 add } def " + chain + " 0 p599 =")
+    assert output.getvalue() == "1\n"
+
+
+def test_deeply_nested_branches_are_not_memoized(make_interpreter):
+    (interpreter, output) = make_interpreter(memo_size=ssps.MEMO_SIZE)
+    interpreter.run("/deep { " + "dup 0 gt { " * 1500 + "1 sub " + "} if " * 1500 + "} def 5 deep =")
+    assert output.getvalue() == "4\n"
@@ -0,0 +1,58 @@
+# Tests for the profiler (-p, -j and -q).
+
+import ssps
+
+FIB = "/fib { /n exch def n 2 lt { n } { n 1 sub fib n 2 sub fib add } ifelse } def 12 fib ="
+DOWN = "/down { dup 0 gt { 1 sub down 1 add } if 0 pop } def 20000 down ="
+
+
+def profile(make_interpreter, interval, program=FIB):
+    """
+    Profiles program with an interpreter from make_interpreter, timing every interval-th call,
+    and returns the profiler.
+    """
+    (interpreter, output) = make_interpreter(profiling=interval)
+    interpreter.run(program)
+    return interpreter.profiler
+
+
+def test_sampling_still_counts_every_call(make_interpreter):
+    full = profile(make_interpreter, True)
+    sampled = profile(make_interpreter, ssps.PROFILE_INTERVAL)
+    assert {handler: calls for (handler, (calls, elapsed)) in sampled.operators.items()} == \
+        {handler: calls for (handler, (calls, elapsed)) in full.operators.items()}
+    assert sampled.procedures["fib"][0] == full.procedures["fib"][0] == 465
+    assert sampled.procedures["fib"][1] > 0
+
+
+def test_sampled_recursion_times_are_close_to_full_ones(make_interpreter):
+    (calls, cumulative, own) = profile(make_interpreter, True, DOWN).procedures["down"]
+    sampled = profile(make_interpreter, ssps.PROFILE_INTERVAL, DOWN)
+    (sampled_calls, sampled_cumulative, sampled_own) = sampled.procedures["down"]
+    assert sampled_calls == calls == 20001
+    # The full profile's own overhead makes its times the longer ones.
+    assert cumulative / 3 < sampled_cumulative < cumulative * 1.5
+    assert own / 3 < sampled_own < own * 1.5
+
+
+def test_procedures_ending_in_if_are_charged_for_their_branches(make_interpreter):
+    (interpreter, output) = make_interpreter(profiling=True)
+    interpreter.run("/tail { true { 1 1 50000 { pop } for } if } def "
+                    "/body { true { 1 1 50000 { pop } for } if 0 pop } def tail body")
+    procedures = interpreter.profiler.procedures
+    assert procedures["tail"][1] > procedures["body"][1] / 3
+
+
+def test_tail_call_chains_are_timed_as_one_call(make_interpreter):
+    (interpreter, output) = make_interpreter(profiling=True)
+    interpreter.run("/count { dup 0 gt { 1 sub count } if } def /run { 20000 count pop } def run")
+    procedures = interpreter.profiler.procedures
+    assert procedures["count"][1] >= procedures["count"][2]
+    assert procedures["run"][1] >= procedures["count"][1] > procedures["run"][2]
+
+
+def test_superinstruction_counts(make_interpreter):
+    sequences = profile(make_interpreter, True).sequences()
+    assert sequences["N lt {} {} ifelse"] == 465
+    assert sequences["N sub"] == 464
+    assert sequences["/name exch def"] == 465
@@ -0,0 +1,39 @@
+# Regression tests for scoping: programs whose output must stay the same in static and dynamic mode,
+# no matter how the interpreter gets there.
+
+import pytest
+
+STATIC = pytest.mark.parametrize("static", [False, True], ids=["dynamic", "static"])
+
+
+@pytest.mark.parametrize(("static", "expected"), [(True, "1\n"), (False, "2\n")], ids=["static", "dynamic"])
+def test_tail_call_keeps_callers_definitions(make_interpreter, static, expected):
+    # callee is linked to caller's dictionary, so its def must not overwrite the x g sees.
+    (interpreter, output) = make_interpreter(static)
+    interpreter.run("/caller { /x 1 def /g { x = } def /callee { /x 2 def g } def callee } def caller")
+    assert output.getvalue() == expected
+
+
+@STATIC
+def test_tail_call_in_constant_space(make_interpreter, static):
+    (interpreter, output) = make_interpreter(static)
+    interpreter.run("/count { dup 0 gt { 1 sub count } if } def 100000 count =")
+    assert output.getvalue() == "0\n"
+
+
+@pytest.mark.parametrize(("static", "expected"), [(True, "1\n"), (False, "2\n99\n")], ids=["static", "dynamic"])
+def test_static_link_is_where_the_procedure_was_found(make_interpreter, static, expected):
+    # h is defined globally, so under static scoping the f it calls is the global one, seeing the global x.
+    (interpreter, output) = make_interpreter(static)
+    interpreter.run("/x 1 def /f { x = } def /g { /x 2 def /f { x = 99 = } def h } def /h { f } def g")
+    assert output.getvalue() == expected
+
+
+@STATIC
+def test_long_static_chain(make_interpreter, static):
+    # Every call defines its own copy of dn and calls it, so each one's static link is its caller's dictionary,
+    # and looking up v walks a chain of 5000 of them.
+    (interpreter, output) = make_interpreter(static)
+    interpreter.run("/v 7 def 5000 { dup /dn exch def exch dup 0 gt { 1 sub exch dn v add } { exch pop } ifelse } "
+                    "dup /dn exch def dn =")
+    assert output.getvalue() == "35000\n"
@@ -0,0 +1,24 @@
+# Tests for session mode: a long-lived interpreter fed one fragment at a time.
+
+import io
+
+import pytest
+
+import ssps
+
+
+def test_serving_refuses_to_replace_a_file(tmp_path):
+    program = tmp_path / "setup.ssps"
+    program.write_text("/a 5 def\n")
+    with pytest.raises(ssps.SSPSError):
+        ssps.serve_session(ssps.Interpreter(), str(program))
+    assert program.read_text() == "/a 5 def\n"
+
+
+def test_failed_fragment_leaves_no_frames_behind(make_interpreter):
+    (interpreter, output) = make_interpreter()
+    lines = io.StringIO("/f { /y 1 def foo } def\nf\n/z 2 def\nz =\n")
+    ssps.run_session(interpreter, lines)
+    assert len(interpreter.dict_stack) == 1
+    assert "z" in interpreter.dict_stack[0][0]
+    assert output.getvalue().endswith("2\n")